@@ -2,170 +2,1851 @@ import os
 import csv
 import json
 import ast
+import argparse
+import asyncio
+import bisect
+import cProfile
+import gzip
+import hashlib
+import http.client
+import io
+import itertools
+import mimetypes
+import marshal
+import signal
+import socket
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from http.server import HTTPServer, BaseHTTPRequestHandler
+from types import MappingProxyType
 from urllib.parse import parse_qs, urlparse
-import html
-
-# Global variables to store data
-symptoms_list = []
-diseases_data = {}
-description_data = {}
-medications_data = {}
-diets_data = {}
-precautions_data = {}
-workouts_data = {}
-
-def load_csv_data():
-    """Load CSV data files"""
-    global symptoms_list, diseases_data, description_data, medications_data
-    global diets_data, precautions_data, workouts_data
-
+import difflib
+import pickle
+import pstats
+import random
+import shutil
+import tarfile
+import tempfile
+import warnings
+import zipfile
+import zlib
+from collections import OrderedDict
+
+import jinja2
+import numpy as np
+from markupsafe import Markup, escape
+
+from snapshot import MODEL_BUNDLE_NAME, load_model_bundle, read_snapshot, write_snapshot
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The loaded data files and everything derived from them, see KnowledgeBase.
+# Replaced as a whole on reload, never modified in place.
+knowledge_base = None
+
+# Classifier trained by train_model.py, see load_model_artifacts
+predictor = None
+
+# Samples requests into cProfile when enabled with --profile-rate, see RequestProfiler
+profiler = None
+
+# Startup phase -> seconds, in the order the phases ran, see run_phase
+startup_phases = {}
+
+# Set once the data and model are loaded, the caches warm and the socket bound; see /readyz
+ready = threading.Event()
+
+DATA_PATH = 'Datasets and Rename'
+DATA_FILES = [
+    'Training.csv',
+    'description.csv',
+    'medications.csv',
+    'diets.csv',
+    'precautions_df.csv',
+    'workout_df.csv',
+]
+RULE_FILES = [
+    'symtoms_df.csv',
+    'Symptom-severity.csv',
+]
+
+MODELS_PATH = 'models'
+
+# Number of ranked diseases returned with each prediction
+TOP_K = 3
+MAX_TOP_K = 10
+
+# Rule-based answers below this score fall back to the default disease
+RULE_MIN_SCORE = 20
+RULE_DEFAULT_DISEASE = 'Common Cold'
+
+# Similar known cases returned with each prediction
+SIMILAR_CASES_K = 5
+
+# Distinct symptom sets whose predictions are kept, see PredictionCache
+PREDICTION_CACHE_SIZE = 1024
+
+# Matches returned by /symptoms?q= by default and at most
+TYPEAHEAD_LIMIT = 10
+MAX_TYPEAHEAD_LIMIT = 50
+# Trigram similarity below which a name is not offered as a fuzzy match
+TYPEAHEAD_MIN_SIMILARITY = 0.3
+
+# Records scored per predict_proba call by /api/predict/batch
+BATCH_CHUNK_SIZE = 1024
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+INDEX_CACHE_CONTROL = 'public, max-age=60, must-revalidate'
+
+# Seconds between checks of the data files, see KnowledgeBaseWatcher
+RELOAD_INTERVAL = 2.0
+
+# Seconds a connection may stay idle or stalled mid-request before its thread gives up on it
+REQUEST_TIMEOUT = 10.0
+
+# Compiled knowledge base, see write_kb_snapshot
+KB_SNAPSHOT_PATH = os.path.join('cache', 'knowledge_base.snapshot')
+# Bump when the knowledge-base snapshot payload changes shape or how it is built
+KB_SNAPSHOT_SCHEMA = 3
+
+# Page templates, see Templates
+TEMPLATES_PATH = 'templates'
+TEMPLATE_CACHE_PATH = os.path.join('cache', 'templates')
+
+# Files served under /static/, see StaticFiles
+STATIC_PATH = 'static'
+STATIC_URL = '/static/'
+# Files up to this size are held in memory, larger ones are sent with sendfile
+STATIC_MEMORY_LIMIT = 256 * 1024
+STATIC_CACHE_CONTROL = 'public, max-age=3600'
+# Fingerprinted URLs change whenever the content does
+STATIC_IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+STATIC_COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.html', '.ttf', '.eot')
+STATIC_CONTENT_TYPES = {
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'text/javascript; charset=utf-8',
+    '.svg': 'image/svg+xml',
+    '.woff': 'font/woff',
+    '.woff2': 'font/woff2',
+    '.ttf': 'font/ttf',
+}
+
+# Third-party assets self-hosted under static/, installed by --fetch-assets or,
+# offline, --install-assets. Missing ones are only linked from their CDNs with
+# --cdn-fallback; otherwise pages go without them.
+BOOTSTRAP_CDN = 'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist'
+FONT_AWESOME_CDN = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0'
+VENDOR_ASSETS = {
+    'vendor/bootstrap/css/bootstrap.min.css': BOOTSTRAP_CDN + '/css/bootstrap.min.css',
+    'vendor/bootstrap/js/bootstrap.bundle.min.js': BOOTSTRAP_CDN + '/js/bootstrap.bundle.min.js',
+    # all.min.css loads the fonts from ../webfonts/
+    'vendor/fontawesome/css/all.min.css': FONT_AWESOME_CDN + '/css/all.min.css',
+    **{
+        f'vendor/fontawesome/webfonts/{font}.{ext}': f'{FONT_AWESOME_CDN}/webfonts/{font}.{ext}'
+        for font in ('fa-brands-400', 'fa-regular-400', 'fa-solid-900', 'fa-v4compatibility')
+        for ext in ('woff2', 'ttf')
+    },
+}
+
+def json_default(obj):
+    """Encode the read-only mappings handed out by the knowledge base"""
+    if isinstance(obj, MappingProxyType):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def json_bytes(obj):
+    """Serialize to compact UTF-8 JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=json_default)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=json_default).encode()
+
+# Upper bounds of the request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Seconds between writes of a worker's metrics for the other workers to report, see Metrics.share
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS = {
+    'medrec_http_requests_total': ('counter', 'HTTP requests by route, method and status'),
+    'medrec_http_request_duration_seconds': ('histogram', 'HTTP request latency by route and method'),
+    'medrec_http_requests_in_flight': ('gauge', 'HTTP requests currently being handled'),
+    'medrec_predictions_total': ('counter', 'Predicted diseases by route'),
+    'medrec_errors_total': ('counter', 'Errors caught while handling requests'),
+    'medrec_cache_requests_total': ('counter', 'Cache lookups by cache and result'),
+    'medrec_cache_hit_ratio': ('gauge', 'Fraction of cache lookups that were hits'),
+    'medrec_cache_evictions_total': ('counter', 'Entries dropped from a cache, for space or because their version changed'),
+    'medrec_cache_entries': ('gauge', 'Entries currently held by a cache'),
+    'medrec_knowledge_base_loads_total': ('counter', 'Knowledge-base loads by result'),
+    'medrec_knowledge_base_load_seconds': ('gauge', 'Duration of the last successful knowledge-base load'),
+    'medrec_model_info': ('gauge', 'The loaded model, by class, version and source'),
+    'medrec_model_load_seconds': ('gauge', 'Duration of the model load at startup'),
+    'medrec_process_resident_memory_bytes': ('gauge', 'Resident memory of this process: anonymous, file-backed and total'),
+    'medrec_startup_phase_seconds': ('gauge', 'Duration of each startup phase'),
+    'medrec_ready': ('gauge', '1 once startup has finished and the process serves requests'),
+}
+
+class MetricsShard:
+    """Metric values recorded by one thread; only that thread ever writes to it"""
+
+    __slots__ = ('counters', 'gauges', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        # (name, labels) -> [count per bucket..., count above the last bucket, sum]
+        self.histograms = {}
+
+class Metrics:
+    """Prometheus metrics, recorded into per-thread shards.
+
+    Recording touches only the calling thread's shard, so the request path
+    takes no lock; the shards are summed when /metrics is scraped. Labels are
+    tuples of (name, value) pairs.
+
+    With several worker processes, any of which may answer a scrape, each
+    one writes its values to a file in a shared directory every
+    METRICS_FLUSH_INTERVAL (see share and forked). The worker answering
+    /metrics adds up the counters and histograms of all of them, including
+    workers that have exited so counters never go backwards, and reports
+    the gauges of live workers with a worker label.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.values = {}
+        self.directory = None
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = MetricsShard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        counters = self.shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def add(self, name, labels=(), value=1):
+        """Move a gauge that is summed over threads, e.g. requests in flight"""
+        gauges = self.shard().gauges
+        key = (name, labels)
+        gauges[key] = gauges.get(key, 0) + value
+
+    def set(self, name, labels=(), value=0):
+        """Set a process-wide gauge"""
+        self.values[(name, labels)] = value
+
+    def observe(self, name, labels, value):
+        histograms = self.shard().histograms
+        key = (name, labels)
+        counts = histograms.get(key)
+        if counts is None:
+            counts = histograms[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def cache(self, name, hit):
+        self.inc('medrec_cache_requests_total', (('cache', name), ('result', 'hit' if hit else 'miss')))
+
+    def share(self, directory):
+        """Report the values of every process that writes to directory.
+
+        Called before forking the workers; the counts recorded so far, at
+        startup, are written once here, and each worker calls forked().
+        """
+        self.directory = directory
+        self.flush(gauges=False)
+
+    def forked(self):
+        """Start a worker from zero, so the counts written by share are not counted twice"""
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def path(self, pid):
+        return os.path.join(self.directory, f"{pid}.metrics")
+
+    def flush(self, gauges=True):
+        """Write this process's values for the other workers to report"""
+        counters, own_gauges, histograms = self.collect_local()
+        path = self.path(os.getpid())
+        with open(path + '.tmp', 'wb') as f:
+            marshal.dump((counters, own_gauges if gauges else {}, histograms), f)
+        os.replace(path + '.tmp', path)
+
+    def collect_local(self):
+        """Sum the shards of this process into (counters, gauges, histograms) dicts"""
+        with self._lock:
+            shards = list(self._shards)
+        counters, gauges, histograms = {}, dict(self.values), {}
+        for shard in shards:
+            # dict.copy() is atomic, so a shard can be read while its thread writes
+            for key, value in shard.counters.copy().items():
+                counters[key] = counters.get(key, 0) + value
+            for key, value in shard.gauges.copy().items():
+                gauges[key] = gauges.get(key, 0) + value
+            for key, counts in shard.histograms.copy().items():
+                total = histograms.setdefault(key, [0] * len(counts))
+                for i, count in enumerate(list(counts)):
+                    total[i] += count
+        return counters, gauges, histograms
+
+    def collect_shared(self, counters, gauges, histograms):
+        """Add the values the other workers wrote to this process's own"""
+        pid = os.getpid()
+        merged = {(name, labels + (('worker', str(pid)),)): value for (name, labels), value in gauges.items()}
+        for filename in os.listdir(self.directory):
+            other, _, extension = filename.partition('.')
+            if extension != 'metrics' or other == str(pid):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), 'rb') as f:
+                    other_counters, other_gauges, other_histograms = marshal.load(f)
+            except (OSError, EOFError, ValueError, TypeError):
+                continue
+            for key, value in other_counters.items():
+                counters[key] = counters.get(key, 0) + value
+            for key, counts in other_histograms.items():
+                total = histograms.setdefault(key, [0] * len(counts))
+                for i, count in enumerate(counts):
+                    total[i] += count
+            if other_gauges and process_alive(int(other)):
+                for (name, labels), value in other_gauges.items():
+                    merged[(name, labels + (('worker', other),))] = value
+        return counters, merged, histograms
+
+    def collect(self):
+        """Sum all shards, and with share() all workers, into (counters, gauges, histograms) dicts"""
+        counters, gauges, histograms = self.collect_local()
+        if self.directory is not None:
+            counters, gauges, histograms = self.collect_shared(counters, gauges, histograms)
+
+        hits = {}
+        for (name, labels), value in counters.items():
+            if name == 'medrec_cache_requests_total':
+                labels = dict(labels)
+                entry = hits.setdefault(labels['cache'], [0, 0])
+                entry[labels['result'] == 'hit'] += value
+        for cache, (misses, hit_count) in hits.items():
+            gauges[('medrec_cache_hit_ratio', (('cache', cache),))] = hit_count / (hit_count + misses)
+        return counters, gauges, histograms
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        counters, gauges, histograms = self.collect()
+        samples = {}
+        for values in (counters, gauges):
+            for (name, labels), value in sorted(values.items()):
+                samples.setdefault(name, []).append(format_sample(name, labels, value))
+        for (name, labels), counts in sorted(histograms.items()):
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(format_sample(name + '_bucket', labels + (('le', le),), cumulative))
+            lines.append(format_sample(name + '_sum', labels, counts[-1]))
+            lines.append(format_sample(name + '_count', labels, cumulative))
+
+        out = []
+        for name, (kind, help_text) in METRICS.items():
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(samples.get(name, ()))
+        out.append('')
+        return '\n'.join(out).encode()
+
+def format_sample(name, labels, value):
+    if labels:
+        escaped = ','.join(
+            '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for k, v in labels
+        )
+        name = f"{name}{{{escaped}}}"
+    return f"{name} {value}"
+
+metrics = Metrics()
+
+def process_alive(pid):
     try:
-        data_path = 'Datasets and Rename'
-
-        # Load training data to get symptoms
-        with open(os.path.join(data_path, 'Training.csv'), 'r') as f:
-            reader = csv.DictReader(f)
-            first_row = next(reader)
-            symptoms_list = [col for col in first_row.keys() if col != 'prognosis']
-
-        # Load descriptions
-        with open(os.path.join(data_path, 'description.csv'), 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                description_data[row['Disease']] = row['Description']
-
-        # Load medications
-        with open(os.path.join(data_path, 'medications.csv'), 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                try:
-                    medications_data[row['Disease']] = ast.literal_eval(row['Medication'])
-                except:
-                    medications_data[row['Disease']] = [row['Medication']]
-
-        # Load diets
-        with open(os.path.join(data_path, 'diets.csv'), 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                try:
-                    diets_data[row['Disease']] = ast.literal_eval(row['Diet'])
-                except:
-                    diets_data[row['Disease']] = [row['Diet']]
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class MetricsFlusher(threading.Thread):
+    """Background thread writing a worker's metrics every interval, see Metrics.share"""
+
+    def __init__(self, interval=METRICS_FLUSH_INTERVAL):
+        super().__init__(name='medrec-metrics-flusher', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                metrics.flush()
+            except OSError as e:
+                print(f"Could not write metrics for other workers: {e}")
+
+    def stop(self):
+        self.stopped.set()
+
+class RequestProfiler:
+    """Runs a random sample of requests under cProfile and aggregates the stats per route.
+
+    Only one request is profiled at a time: a thread's profiler sees just
+    that thread, and newer Pythons allow a single active profiler per
+    process anyway. Requests arriving while another is being profiled are
+    simply not sampled.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.routes = {}
+        self._active = threading.Lock()
+        self._lock = threading.Lock()
+
+    def run(self, route, handle):
+        """Call handle(), under the profiler when this request is sampled"""
+        if random.random() >= self.rate or not self._active.acquire(blocking=False):
+            return handle()
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(handle)
+        finally:
+            self._active.release()
+            profile.create_stats()
+            with self._lock:
+                entry = self.routes.get(route)
+                if entry is None:
+                    self.routes[route] = [1, pstats.Stats(profile)]
+                else:
+                    entry[0] += 1
+                    entry[1].add(profile)
+
+    def snapshot(self, route=None):
+        """Copy the aggregated stats as [(route, sampled requests, Stats)]"""
+        copies = []
+        with self._lock:
+            for name, (count, stats) in sorted(self.routes.items()):
+                if route is None or name == route:
+                    copy = pstats.Stats()
+                    copy.add(stats)
+                    copies.append((name, count, copy))
+        return copies
+
+    def report(self, route=None, sort='cumulative', limit=25):
+        """Text listing of the top functions per route"""
+        out = io.StringIO()
+        for name, count, stats in self.snapshot(route):
+            out.write(f"==== {name}: {count} sampled requests ====\n")
+            stats.stream = out
+            stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue() or "No requests sampled yet\n"
+
+    def dump(self, route=None):
+        """Aggregated stats in the marshal format read by pstats.Stats(filename)"""
+        combined = None
+        for _, _, stats in self.snapshot(route):
+            if combined is None:
+                combined = stats
+            else:
+                combined.add(stats)
+        return marshal.dumps(combined.stats if combined is not None else {})
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+
+def compute_data_version(data_path=DATA_PATH, files=DATA_FILES):
+    """Hash the contents of the data files"""
+    digest = hashlib.sha256()
+    for name in files:
+        digest.update(name.encode())
+        with open(os.path.join(data_path, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def write_kb_snapshot(kb, path=KB_SNAPSHOT_PATH):
+    """Save a knowledge base as a snapshot keyed by the source file hashes"""
+    payload = {
+        'symptoms_list': kb.symptoms_list,
+        'diseases': [record.fields() for record in kb.diseases],
+        'rule_engine': {
+            'diseases': kb.rule_engine.diseases,
+            'symptoms': list(kb.rule_engine.symptom_index),
+            'matrix': kb.rule_engine.matrix,
+        },
+        'similarity_index': {
+            'symptoms': kb.similarity_index.symptoms,
+            'words': kb.similarity_index.words,
+            'popcounts': kb.similarity_index.popcounts,
+            'prognoses': kb.similarity_index.prognoses,
+            'counts': kb.similarity_index.counts,
+        },
+    }
+    meta = {'kind': 'knowledge_base', 'schema': KB_SNAPSHOT_SCHEMA, 'data_version': kb.version,
+            'rules_version': kb.rule_engine.version}
+    write_snapshot(path, meta, payload)
+
+def load_kb_snapshot(path, expected_data_version, expected_rules_version):
+    """Load a knowledge-base snapshot if it was built from the current source files"""
+    snapshot = read_snapshot(path)
+    if snapshot is None:
+        return None
+    meta, payload = snapshot
+    if (meta.get('kind') != 'knowledge_base'
+            or meta.get('schema') != KB_SNAPSHOT_SCHEMA
+            or meta.get('data_version') != expected_data_version
+            or meta.get('rules_version') != expected_rules_version):
+        return None
+
+    rules = payload['rule_engine']
+    similar = payload['similarity_index']
+    return KnowledgeBase(
+        expected_data_version,
+        payload['symptoms_list'],
+        [DiseaseRecord(*fields) for fields in payload['diseases']],
+        RuleEngine(rules['diseases'], rules['symptoms'], rules['matrix'], expected_rules_version),
+        SimilarityIndex(similar['symptoms'], similar['words'], similar['popcounts'],
+                        similar['prognoses'], similar['counts']),
+    )
+
+class KnowledgeBase:
+    """The data files and everything derived from them, for one version of the files.
+
+    A KnowledgeBase is complete when constructed and never changed after
+    that: reloading builds a new one and publishes it by rebinding the
+    module-level knowledge_base. A request reads that reference once and
+    uses it throughout, so it never sees a half-loaded state, and caches
+    hanging off the object (result pages, resolved names) are dropped with it.
+    """
+
+    def __init__(self, version, symptoms_list, diseases, rule_engine, similarity_index):
+        self.version = version
+        self.symptoms_list = tuple(sys.intern(symptom) for symptom in symptoms_list)
+        # A record's id is its position in diseases
+        self.diseases = tuple(diseases)
+        self.disease_index = {record.name: record for record in self.diseases}
+        self.rule_engine = rule_engine
+        self.similarity_index = similarity_index
+        # Static response bodies, encoded once per version
+        self.symptoms_json = json_bytes({'symptoms': sorted(self.symptoms_list)})
+        self.resolve_disease_name = make_disease_name_resolver(
+            record.name for record in self.diseases if record.description)
+        self.result_page_segments = build_result_pages(self)
+
+    def get_disease(self, key):
+        """Look up a DiseaseRecord by id or by name; None when unknown"""
+        if isinstance(key, int):
+            return self.diseases[key] if 0 <= key < len(self.diseases) else None
+        return self.disease_index.get(key)
+
+class DiseaseRecord:
+    """Everything known about one disease, immutable and shared by all requests"""
+
+    __slots__ = ('id', 'name', 'description', 'medications', 'diet', 'precautions', 'workouts',
+                 'info_json', 'info')
+
+    def __init__(self, id, name, description, medications, diet, precautions, workouts):
+        intern_all = lambda items: tuple(sys.intern(item) for item in items)
+        self.id = id
+        self.name = sys.intern(name)
+        self.description = sys.intern(description)
+        self.medications = intern_all(medications)
+        self.diet = intern_all(diet)
+        self.precautions = intern_all(precautions)
+        self.workouts = intern_all(workouts)
+        # Read-only view handed out by get_disease_info instead of a fresh dict
+        self.info = MappingProxyType({
+            'description': self.description,
+            'medications': self.medications,
+            'diet': self.diet,
+            'precautions': self.precautions,
+            'workouts': self.workouts,
+        })
+        # Pre-encoded info block spliced into /api/predict responses
+        self.info_json = json_bytes(self.info)
+
+    def __setattr__(self, name, value):
+        if hasattr(self, 'info_json'):
+            raise AttributeError("DiseaseRecord is read-only")
+        object.__setattr__(self, name, value)
+
+    def fields(self):
+        """Constructor arguments, for the knowledge-base snapshot"""
+        return (self.id, self.name, self.description, self.medications, self.diet,
+                self.precautions, self.workouts)
+
+# Stands in for diseases that are not in the knowledge base
+EMPTY_DISEASE = DiseaseRecord(-1, '', '', (), (), (), ())
+EMPTY_DISEASE_INFO = EMPTY_DISEASE.info
+
+def make_disease_name_resolver(disease_names):
+    """Return a function mapping a label from any data file to the description.csv spelling"""
+    normalized = {' '.join(name.split()).lower(): name for name in disease_names}
+    resolved = {}
+
+    def resolve(label):
+        name = resolved.get(label)
+        if name is None:
+            key = ' '.join(label.split()).lower()
+            if key in normalized:
+                name = normalized[key]
+            else:
+                close = difflib.get_close_matches(key, normalized, n=1, cutoff=0.9)
+                name = normalized[close[0]] if close else label.strip()
+            resolved[label] = name
+        return name
+
+    return resolve
+
+def read_knowledge_base(data_path=DATA_PATH, use_snapshot=True, previous=None):
+    """Build a KnowledgeBase from the data files.
+
+    When the knowledge-base snapshot matches the hash of the CSV files it is
+    loaded instead of parsing them; otherwise the CSVs are parsed and the
+    snapshot is rewritten. The rule matrix of previous is reused when its
+    source files did not change.
+    """
+    data_version = compute_data_version(data_path)
+    rules_version = compute_data_version(data_path, RULE_FILES)
+
+    if use_snapshot:
+        kb = load_kb_snapshot(KB_SNAPSHOT_PATH, data_version, rules_version)
+        metrics.cache('kb_snapshot', kb is not None)
+        if kb is not None:
+            return kb
+
+    # Load training data to get symptoms
+    with open(os.path.join(data_path, 'Training.csv'), 'r') as f:
+        reader = csv.DictReader(f)
+        first_row = next(reader)
+        symptoms_list = [col for col in first_row.keys() if col != 'prognosis']
+
+    # Load descriptions
+    description_data = {}
+    with open(os.path.join(data_path, 'description.csv'), 'r') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            description_data[row['Disease']] = row['Description']
+
+    # Load medications
+    medications_data = {}
+    with open(os.path.join(data_path, 'medications.csv'), 'r') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            try:
+                medications_data[row['Disease']] = ast.literal_eval(row['Medication'])
+            except:
+                medications_data[row['Disease']] = [row['Medication']]
+
+    # Load diets
+    diets_data = {}
+    with open(os.path.join(data_path, 'diets.csv'), 'r') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            try:
+                diets_data[row['Disease']] = ast.literal_eval(row['Diet'])
+            except:
+                diets_data[row['Disease']] = [row['Diet']]
+
+    # Load precautions
+    precautions_data = {}
+    with open(os.path.join(data_path, 'precautions_df.csv'), 'r') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            precautions = []
+            for i in range(1, 5):
+                col_name = f'Precaution_{i}'
+                if col_name in row and row[col_name]:
+                    precautions.append(row[col_name])
+            precautions_data[row['Disease']] = precautions
+
+    # Load workouts
+    workouts_data = {}
+    with open(os.path.join(data_path, 'workout_df.csv'), 'r') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            try:
+                workouts_data[row['disease']] = ast.literal_eval(row['workout'])
+            except:
+                workouts_data[row['disease']] = [row['workout']]
+
+    resolve = make_disease_name_resolver(description_data)
+
+    def by_resolved_name(data):
+        # The files spell some diseases differently ('Diabetes ', 'Peptic ulcer diseae');
+        # an exact spelling wins over a resolved one
+        merged = {}
+        for label, value in data.items():
+            name = resolve(label)
+            if label == name or name not in merged:
+                merged[name] = value
+        return merged
+
+    medications_data, diets_data, precautions_data, workouts_data = (
+        by_resolved_name(data) for data in (medications_data, diets_data, precautions_data, workouts_data))
+
+    # One record per disease of description.csv, in its order
+    diseases = [
+        DiseaseRecord(disease_id, name, description_data[name],
+                      medications_data.get(name, ()), diets_data.get(name, ()),
+                      precautions_data.get(name, ()), workouts_data.get(name, ()))
+        for disease_id, name in enumerate(description_data)
+    ]
+
+    # Recompile the rule matrix only when its source files changed
+    if previous is not None and previous.rule_engine.version == rules_version:
+        rule_engine = previous.rule_engine
+    else:
+        rule_engine = RuleEngine.compile(data_path, rules_version, resolve)
+
+    similarity_index = SimilarityIndex.build(data_path, resolve)
+
+    kb = KnowledgeBase(data_version, symptoms_list, diseases, rule_engine, similarity_index)
+
+    if use_snapshot:
+        try:
+            write_kb_snapshot(kb, KB_SNAPSHOT_PATH)
+        except OSError as e:
+            print(f"Could not write knowledge-base snapshot: {e}")
+    return kb
 
-        # Load precautions
-        with open(os.path.join(data_path, 'precautions_df.csv'), 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                precautions = []
-                for i in range(1, 5):
-                    col_name = f'Precaution_{i}'
-                    if col_name in row and row[col_name]:
-                        precautions.append(row[col_name])
-                precautions_data[row['Disease']] = precautions
-
-        # Load workouts
-        with open(os.path.join(data_path, 'workout_df.csv'), 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                try:
-                    workouts_data[row['disease']] = ast.literal_eval(row['workout'])
-                except:
-                    workouts_data[row['disease']] = [row['workout']]
+def load_csv_data(use_snapshot=True):
+    """Load CSV data files and publish them as the current knowledge base"""
+    global knowledge_base
 
+    try:
+        start = time.perf_counter()
+        kb = read_knowledge_base(DATA_PATH, use_snapshot, knowledge_base)
+        if knowledge_base is not None and knowledge_base.version == kb.version \
+                and knowledge_base.rule_engine.version == kb.rule_engine.version:
+            # Nothing changed; keep the caches that hang off the current one
+            metrics.inc('medrec_knowledge_base_loads_total', (('result', 'unchanged'),))
+            return True
+        # A single reference assignment: readers see the old or the new one
+        knowledge_base = kb
+        symptom_search(kb)
+        metrics.set('medrec_knowledge_base_load_seconds', (), time.perf_counter() - start)
+        metrics.inc('medrec_knowledge_base_loads_total', (('result', 'loaded'),))
         print("All data loaded successfully!")
         return True
 
     except Exception as e:
+        metrics.inc('medrec_knowledge_base_loads_total', (('result', 'error'),))
         print(f"Error loading data: {e}")
         return False
 
-def predict_disease(selected_symptoms):
-    """Simple rule-based disease prediction"""
-    # Simple symptom-to-disease mapping for demonstration
-    disease_rules = {
-        'Common Cold': ['runny_nose', 'sneezing', 'cough', 'sore_throat'],
-        'Flu': ['fever', 'chills', 'muscle_aches', 'fatigue', 'headache'],
-        'Gastroenteritis': ['stomach_pain', 'nausea', 'vomiting', 'diarrhoea'],
-        'Migraine': ['headache', 'nausea', 'vomiting', 'sensitivity_to_light'],
-        'Hypertension': ['headache', 'dizziness', 'chest_pain'],
-        'Diabetes': ['increased_thirst', 'frequent_urination', 'fatigue', 'blurred_vision'],
-        'Bronchial Asthma': ['cough', 'shortness_of_breath', 'wheezing'],
-        'Malaria': ['fever', 'chills', 'headache', 'nausea', 'vomiting'],
-        'Dengue': ['fever', 'headache', 'muscle_aches', 'nausea', 'rash'],
-        'Pneumonia': ['cough', 'fever', 'shortness_of_breath', 'chest_pain']
-    }
-
-    # Calculate match scores
-    best_match = None
-    best_score = 0
-
-    for disease, disease_symptoms in disease_rules.items():
-        # Count matching symptoms
-        matches = sum(1 for symptom in selected_symptoms if symptom in disease_symptoms)
-        score = (matches / len(disease_symptoms)) * 100 if disease_symptoms else 0
-
-        if score > best_score:
-            best_score = score
-            best_match = disease
-
+def data_files_signature(data_path=DATA_PATH):
+    """Cheap stat-based fingerprint of the data files, used to notice changes"""
+    signature = []
+    for name in DATA_FILES + RULE_FILES:
+        try:
+            st = os.stat(os.path.join(data_path, name))
+            signature.append((name, st.st_size, st.st_mtime_ns))
+        except OSError:
+            signature.append((name, None, None))
+    return tuple(signature)
+
+class KnowledgeBaseWatcher(threading.Thread):
+    """Background thread that reloads the knowledge base when the data files change.
+
+    The files are polled with os.stat; a change is only acted on once the
+    files have stayed the same for one more interval, so a CSV that is still
+    being written is not picked up half way. The rebuild runs here, off the
+    request path, and a failed reload keeps serving the previous version.
+    """
+
+    def __init__(self, interval=RELOAD_INTERVAL, data_path=DATA_PATH):
+        super().__init__(name='medrec-kb-watcher', daemon=True)
+        self.interval = interval
+        self.data_path = data_path
+        self.stopped = threading.Event()
+
+    def run(self):
+        seen = data_files_signature(self.data_path)
+        pending = None
+        while not self.stopped.wait(self.interval):
+            current = data_files_signature(self.data_path)
+            if current == seen:
+                pending = None
+                continue
+            if current != pending:
+                pending = current
+                continue
+            seen = current
+            pending = None
+            before = knowledge_base
+            if load_csv_data() and knowledge_base is not before:
+                print(f"🔄 Knowledge base reloaded (version {knowledge_base.version[:12]})")
+
+    def stop(self):
+        self.stopped.set()
+
+class RuleEngine:
+    """Rule-based predictor compiled from symtoms_df.csv and Symptom-severity.csv.
+
+    Every disease is a row of a weighted disease x symptom matrix: a symptom's
+    severity weight divided by the total weight of the disease's symptoms,
+    times 100. Scoring all diseases is then one matrix-vector product that
+    gives the weighted percentage of each disease's symptoms that are present.
+    """
+
+    def __init__(self, diseases, symptoms, matrix, version):
+        self.diseases = diseases
+        self.symptom_index = {symptom: i for i, symptom in enumerate(symptoms)}
+        self.matrix = matrix
+        self.version = version
+
+    @classmethod
+    def compile(cls, data_path, version, resolve_disease_name):
+        """Build the weighted matrix from the rule CSV files"""
+        weights = {}
+        with open(os.path.join(data_path, 'Symptom-severity.csv'), 'r') as f:
+            for row in csv.DictReader(f):
+                weights[row['Symptom'].strip()] = float(row['weight'])
+
+        disease_symptoms = {}
+        with open(os.path.join(data_path, 'symtoms_df.csv'), 'r') as f:
+            for row in csv.DictReader(f):
+                disease = resolve_disease_name(row['Disease'])
+                found = disease_symptoms.setdefault(disease, set())
+                for i in range(1, 5):
+                    symptom = (row.get(f'Symptom_{i}') or '').strip()
+                    if symptom:
+                        found.add(symptom)
+
+        diseases = sorted(disease_symptoms)
+        symptoms = sorted(set().union(*disease_symptoms.values()))
+        column = {symptom: i for i, symptom in enumerate(symptoms)}
+        matrix = np.zeros((len(diseases), len(symptoms)), dtype=np.float32)
+        for row, disease in enumerate(diseases):
+            for symptom in disease_symptoms[disease]:
+                matrix[row, column[symptom]] = weights.get(symptom, 1.0)
+        totals = matrix.sum(axis=1, keepdims=True)
+        matrix *= 100 / np.where(totals > 0, totals, 1)
+        return cls(diseases, symptoms, matrix, version)
+
+    def vectorize(self, selected_symptoms):
+        """Build the query vector; returns None when no symptom is known"""
+        columns = [self.symptom_index[s] for s in selected_symptoms if s in self.symptom_index]
+        if not columns:
+            return None
+        query = np.zeros(self.matrix.shape[1], dtype=np.float32)
+        query[columns] = 1.0
+        return query
+
+    def predict_top_k(self, selected_symptoms, k=TOP_K):
+        """Return up to k (disease, score %) pairs with a non-zero score, best first"""
+        query = self.vectorize(selected_symptoms)
+        if query is None:
+            return []
+        scores = self.matrix @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.diseases[i], float(scores[i])) for i in top if scores[i] > 0]
+
+def predict_disease_rules(selected_symptoms, k=TOP_K, kb=None):
+    """Rule-based disease prediction"""
+    kb = kb or knowledge_base
+    predictions = kb.rule_engine.predict_top_k(selected_symptoms, k) if kb is not None else []
     # If no good match, return a default
-    if best_score < 20:
-        best_match = 'Common Cold'
-        best_score = 50
-
-    return best_match, best_score
-
-def get_disease_info(disease_name):
-    """Get comprehensive information about a disease"""
-    info = {
-        'description': '',
-        'medications': [],
-        'diet': [],
-        'precautions': [],
-        'workouts': []
-    }
-
+    if not predictions or predictions[0][1] < RULE_MIN_SCORE:
+        return [(RULE_DEFAULT_DISEASE, 50)]
+    return predictions
+
+class ModelPredictor:
+    """Scores symptom sets with the classifier saved by train_model.py"""
+
+    def __init__(self, model, classes, symptoms_dict, version=None):
+        self.model = model
+        self.version = version
+        self.symptoms_dict = symptoms_dict
+        self.n_features = getattr(model, 'n_features_in_', max(symptoms_dict.values()) + 1)
+        # Labels keep the Training.csv spelling; predict_top_k resolves them
+        # against the current knowledge base
+        self.labels = [str(label) for label in classes]
+
+    def vectorize(self, selected_symptoms):
+        """Build the one-hot feature row; returns None when no symptom is known"""
+        columns = [self.symptoms_dict[s] for s in selected_symptoms if s in self.symptoms_dict]
+        if not columns:
+            return None
+        features = np.zeros((1, self.n_features))
+        features[0, columns] = 1.0
+        return features
+
+    def vectorize_batch(self, symptom_sets):
+        """Build one feature matrix with a row per symptom set"""
+        rows = []
+        columns = []
+        for row, selected_symptoms in enumerate(symptom_sets):
+            for s in selected_symptoms:
+                column = self.symptoms_dict.get(s)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+        features = np.zeros((len(symptom_sets), self.n_features))
+        features[rows, columns] = 1.0
+        return features
+
+    def predict_top_k_batch(self, symptom_sets, k=TOP_K):
+        """Score many symptom sets in one predict_proba call.
+
+        Returns one list of (disease, confidence %) pairs per set; sets with
+        no known symptom get an empty list.
+        """
+        if not symptom_sets:
+            return []
+        features = self.vectorize_batch(symptom_sets)
+        known = features.any(axis=1)
+        results = [[] for _ in symptom_sets]
+        if not known.any():
+            return results
+        proba = self.model.predict_proba(features[known])
+        k = min(k, proba.shape[1])
+        top = np.argpartition(-proba, k - 1, axis=1)[:, :k]
+        top_proba = np.take_along_axis(proba, top, axis=1)
+        order = np.argsort(-top_proba, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_proba = np.take_along_axis(top_proba, order, axis=1) * 100
+        for row, indices, scores in zip(np.flatnonzero(known), top.tolist(), top_proba.tolist()):
+            results[row] = [(self.labels[i], score) for i, score in zip(indices, scores)]
+        return results
+
+    def predict_top_k(self, selected_symptoms, k=TOP_K):
+        """Return up to k (disease, confidence %) pairs, best first"""
+        features = self.vectorize(selected_symptoms)
+        if features is None:
+            return []
+        proba = self.model.predict_proba(features)[0]
+        k = min(k, len(proba))
+        top = np.argpartition(-proba, k - 1)[:k]
+        top = top[np.argsort(-proba[top], kind='stable')]
+        return [(self.labels[i], float(proba[i]) * 100) for i in top]
+
+def load_model_artifacts(models_path=MODELS_PATH):
+    """Load the trained model, its class names and symptoms_dict saved by train_model.py.
+
+    Reads the model bundle, or the separate pickles written by earlier
+    versions of train_model.py when there is no bundle. Only a bundle
+    holding a model_runtime model spares the server importing scikit-learn.
+    """
+    global predictor
+
+    start = time.perf_counter()
+    bundle_path = os.path.join(models_path, MODEL_BUNDLE_NAME)
     try:
-        # Get description
-        if disease_name in description_data:
-            info['description'] = description_data[disease_name]
-
-        # Get medications
-        if disease_name in medications_data:
-            info['medications'] = medications_data[disease_name]
-
-        # Get diet recommendations
-        if disease_name in diets_data:
-            info['diet'] = diets_data[disease_name]
-
-        # Get precautions
-        if disease_name in precautions_data:
-            info['precautions'] = precautions_data[disease_name]
-
-        # Get workout recommendations
-        if disease_name in workouts_data:
-            info['workouts'] = workouts_data[disease_name]
-
+        if os.path.exists(bundle_path):
+            meta, payload = load_model_bundle(bundle_path)
+            model = payload['model']
+            classes = payload['classes']
+            symptoms_dict = payload['symptoms_dict']
+            version, source = meta['digest'][:16], MODEL_BUNDLE_NAME
+        else:
+            with open(os.path.join(models_path, 'disease_prediction_model.pkl'), 'rb') as f:
+                model = pickle.load(f)
+            with open(os.path.join(models_path, 'label_encoder.pkl'), 'rb') as f:
+                classes = pickle.load(f).classes_
+            with open(os.path.join(models_path, 'symptoms_dict.pkl'), 'rb') as f:
+                symptoms_dict = pickle.load(f)
+            version, source = None, 'pickles'
+            print(f"⚠️  No {MODEL_BUNDLE_NAME} in '{models_path}'; loading the legacy pickles. "
+                  f"Run train_model.py to replace them with a bundle")
+    except FileNotFoundError:
+        print(f"No trained model in '{models_path}'; using rule-based predictions")
+        predictor = None
+        return False
     except Exception as e:
-        print(f"Error getting disease info: {e}")
-
+        print(f"Error loading model: {e}; using rule-based predictions")
+        predictor = None
+        return False
+    elapsed = time.perf_counter() - start
+
+    # The model was fitted on a DataFrame; scoring plain arrays is intended
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    predictor = ModelPredictor(model, classes, symptoms_dict, version)
+    metrics.set('medrec_model_load_seconds', (), elapsed)
+    metrics.set('medrec_model_info', (('model', type(model).__name__), ('version', version or ''),
+                                      ('source', source)), 1)
+    print(f"Model loaded: {type(model).__name__} ({len(predictor.labels)} diseases) "
+          f"from {source}{f' {version}' if version else ''} in {elapsed * 1000:.1f} ms")
+    return True
+
+def process_memory():
+    """Resident memory of this process in bytes: {'total', 'anon', 'file'}, or None.
+
+    Pages of memory-mapped files (the snapshots, the model bundle) are
+    counted under 'file' and shared with every process mapping them;
+    'anon' is heap, which forked workers share with the parent only until
+    either side writes to it. Needs Linux's /proc.
+    """
+    fields = {'VmRSS:': 'total', 'RssAnon:': 'anon', 'RssFile:': 'file'}
+    usage = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                parts = line.split()
+                if parts and parts[0] in fields:
+                    usage[fields[parts[0]]] = int(parts[1]) * 1024
+    except (OSError, ValueError):
+        return None
+    return usage or None
+
+def record_memory_metrics():
+    usage = process_memory()
+    for kind, value in (usage or {}).items():
+        metrics.set('medrec_process_resident_memory_bytes', (('kind', kind),), value)
+    return usage
+
+def run_phase(name, func, *args, **kwargs):
+    """Run one startup phase, recording how long it took"""
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - start
+        startup_phases[name] = elapsed
+        metrics.set('medrec_startup_phase_seconds', (('phase', name),), elapsed)
+
+def mark_ready():
+    ready.set()
+    metrics.set('medrec_ready', (), 1)
+
+def predict_top_k(selected_symptoms, k=TOP_K, kb=None):
+    """Predict the k most likely diseases as (disease, confidence %) pairs.
+
+    Uses the trained model when it is loaded and falls back to the
+    rule-based prediction otherwise.
+    """
+    kb = kb or knowledge_base
+    if predictor is not None:
+        predictions = predictor.predict_top_k(selected_symptoms, k)
+        if predictions:
+            return [(kb.resolve_disease_name(label), score) for label, score in predictions]
+    return predict_disease_rules(selected_symptoms, k, kb)
+
+def predict_top_k_batch(symptom_sets, k=TOP_K, kb=None):
+    """Predict the k most likely diseases for each symptom set"""
+    kb = kb or knowledge_base
+    if predictor is not None:
+        results = predictor.predict_top_k_batch(symptom_sets, k)
+    else:
+        results = [[] for _ in symptom_sets]
+    resolve = kb.resolve_disease_name
+    return [
+        [(resolve(label), score) for label, score in predictions]
+        if predictions else predict_disease_rules(selected_symptoms, k, kb)
+        for predictions, selected_symptoms in zip(results, symptom_sets)
+    ]
+
+def predict_disease(selected_symptoms, kb=None):
+    """Predict the most likely disease and its confidence"""
+    return predict_top_k(selected_symptoms, 1, kb)[0]
+
+# Set bits per byte value, for popcount on NumPy versions without bitwise_count
+POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def popcount_rows(words):
+    """Count the set bits in each row of a 2-D uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    return POPCOUNT_TABLE[words.view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+class SimilarityIndex:
+    """Bit-packed index of the distinct symptom vectors in Training.csv.
+
+    Identical (symptoms, prognosis) rows are stored once with a count. Each
+    row is packed into uint64 words, so comparing a query against every case
+    is a few vectorised AND/popcount operations.
+    """
+
+    def __init__(self, symptoms, words, popcounts, prognoses, counts):
+        self.symptoms = symptoms
+        self.symptom_index = {}
+        for i, symptom in enumerate(symptoms):
+            self.symptom_index.setdefault(symptom, i)
+        self.n_words = words.shape[1]
+        self.words = words
+        self.popcounts = popcounts
+        self.prognoses = prognoses
+        self.counts = counts
+        # Tie-breaker smaller than any difference in Jaccard similarity
+        self.rank_bonus = counts / (counts.max() + 1) * 1e-6
+
+    @classmethod
+    def build(cls, data_path, resolve_disease_name):
+        """Read Training.csv and pack its distinct rows"""
+        with open(os.path.join(data_path, 'Training.csv'), 'r') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            target = header.index('prognosis')
+            symptoms = [name for i, name in enumerate(header) if i != target]
+            counts = {}
+            for row in reader:
+                prognosis = row[target]
+                bits = ''.join(value for i, value in enumerate(row) if i != target)
+                key = (bits, prognosis)
+                counts[key] = counts.get(key, 0) + 1
+
+        n_words = (len(symptoms) + 63) // 64
+        rows = np.zeros((len(counts), n_words * 64), dtype=np.uint8)
+        for row, (bits, _) in enumerate(counts):
+            rows[row, :len(bits)] = np.frombuffer(bits.encode(), dtype=np.uint8) - ord('0')
+        words = np.packbits(rows, axis=1, bitorder='little').view(np.uint64)
+        prognoses = [resolve_disease_name(prognosis) for _, prognosis in counts]
+        return cls(symptoms, words, popcount_rows(words),
+                   prognoses, np.fromiter(counts.values(), dtype=np.int64, count=len(counts)))
+
+    def pack(self, selected_symptoms):
+        """Pack a symptom set into one row of words.
+
+        Returns (words, number of set bits), or None when no symptom is known.
+        """
+        words = [0] * self.n_words
+        columns = {self.symptom_index[s] for s in selected_symptoms if s in self.symptom_index}
+        if not columns:
+            return None
+        for column in columns:
+            words[column >> 6] |= 1 << (column & 63)
+        return np.array(words, dtype=np.uint64), len(columns)
+
+    def query(self, selected_symptoms, k=SIMILAR_CASES_K, distinct=False):
+        """Return the k most similar known cases, by Jaccard similarity.
+
+        With distinct=True only the best case of each disease is kept, which
+        turns the result into a differential-diagnosis list.
+        """
+        packed = self.pack(selected_symptoms)
+        if packed is None:
+            return []
+        packed, query_bits = packed
+        shared = popcount_rows(self.words & packed)
+        union = self.popcounts + query_bits - shared
+        similarity = shared / union
+        # Rank by similarity, then by how many training rows share the vector
+        rank = similarity + self.rank_bonus
+        if distinct:
+            top = []
+            seen = set()
+            for i in np.argsort(-rank, kind='stable'):
+                if shared[i] == 0 or len(top) == k:
+                    break
+                if self.prognoses[i] not in seen:
+                    seen.add(self.prognoses[i])
+                    top.append(i)
+        else:
+            k = min(k, len(rank))
+            top = np.argpartition(-rank, k - 1)[:k]
+            top = top[np.argsort(-rank[top], kind='stable')]
+        return [
+            {
+                'disease': self.prognoses[i],
+                'similarity': round(float(similarity[i]) * 100, 2),
+                'distance': int(union[i] - shared[i]),
+                'cases': int(self.counts[i]),
+            }
+            for i in top if shared[i] > 0
+        ]
+
+def normalize_symptom(text):
+    """'dischromic _patches' -> 'dischromic patches'"""
+    return ' '.join(text.replace('_', ' ').lower().split())
+
+def trigrams(text):
+    """Trigrams of each word, padded as in pg_trgm so short words and word starts count"""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class SymptomSearch:
+    """Typeahead index over the normalized symptom names.
+
+    A prefix trie over every word-start suffix of each name answers
+    "skin ra" and "rash" alike; every trie node keeps the ids below it in
+    rank order, so a prefix lookup is one walk down the trie. Queries that
+    match no prefix, typically typos, fall back to trigram similarity.
+    """
+
+    def __init__(self, symptoms):
+        self.symptoms = symptoms
+        self.names = [normalize_symptom(symptom) for symptom in symptoms]
+        self.sorted_symptoms = sorted(symptoms)
+        # Shorter names first, they are the likelier completions
+        order = sorted(range(len(symptoms)), key=lambda i: (len(self.names[i]), self.names[i]))
+        self.rank = {i: r for r, i in enumerate(order)}
+
+        # node: (children by character, ids whose name or a word of it starts here)
+        self.root = ({}, [])
+        for i in order:
+            name = self.names[i]
+            starts = [0] + [j + 1 for j, char in enumerate(name) if char == ' ']
+            for start in starts:
+                node = self.root
+                for char in name[start:]:
+                    node = node[0].setdefault(char, ({}, []))
+                    if not node[1] or node[1][-1] != i:
+                        node[1].append(i)
+
+        self.grams = [trigrams(name) for name in self.names]
+        self.gram_index = {}
+        for i, grams in enumerate(self.grams):
+            for gram in grams:
+                self.gram_index.setdefault(gram, []).append(i)
+
+    def search(self, query, limit=TYPEAHEAD_LIMIT):
+        """Return up to limit symptom names matching query, best first.
+
+        Names starting with the query come first, then names with a word
+        starting with it, then fuzzy matches by trigram similarity.
+        """
+        query = normalize_symptom(query)
+        if not query:
+            return self.sorted_symptoms[:limit]
+
+        node = self.root
+        for char in query:
+            node = node[0].get(char)
+            if node is None:
+                break
+        if node is not None:
+            prefix, word = [], []
+            for i in node[1]:
+                (prefix if self.names[i].startswith(query) else word).append(i)
+            matches = prefix + word
+        else:
+            matches = self.fuzzy(query)
+        return [self.symptoms[i] for i in matches[:limit]]
+
+    def fuzzy(self, query):
+        """Ids by trigram similarity to query, above TYPEAHEAD_MIN_SIMILARITY"""
+        query_grams = trigrams(query)
+        shared = {}
+        for gram in query_grams:
+            for i in self.gram_index.get(gram, ()):
+                shared[i] = shared.get(i, 0) + 1
+        scored = []
+        for i, count in shared.items():
+            similarity = count / (len(query_grams) + len(self.grams[i]) - count)
+            if similarity >= TYPEAHEAD_MIN_SIMILARITY:
+                scored.append((-similarity, self.rank[i], i))
+        scored.sort()
+        return [i for _, _, i in scored]
+
+# The SymptomSearch of the current vocabulary, see symptom_search
+_symptom_search = None
+
+def symptom_search(kb=None):
+    """The typeahead index of a knowledge base, rebuilt only when its symptom list changes"""
+    global _symptom_search
+    kb = kb or knowledge_base
+    index = _symptom_search
+    if index is None or (index.symptoms is not kb.symptoms_list and index.symptoms != kb.symptoms_list):
+        index = _symptom_search = SymptomSearch(kb.symptoms_list)
+    return index
+
+def get_disease_info(disease, symptoms=None, kb=None):
+    """Get comprehensive information about a disease, by name or id.
+
+    Returns the disease's shared read-only info mapping. When the patient's
+    symptoms are given, the most similar known cases are added as a
+    differential-diagnosis list under 'similar_cases' in a new dict.
+    """
+    kb = kb or knowledge_base
+    record = kb.get_disease(disease)
+    info = record.info if record is not None else EMPTY_DISEASE_INFO
+    if symptoms:
+        info = dict(info, similar_cases=kb.similarity_index.query(symptoms, distinct=True))
     return info
 
+class CachedPrediction:
+    """The predictions and similar cases of one canonical symptom set"""
+
+    __slots__ = ('symptoms', 'rankings', 'similar_cases')
+
+    def __init__(self, symptoms, similar_cases):
+        self.symptoms = symptoms
+        # top_k -> [(disease, confidence %)], filled in as each k is asked for
+        self.rankings = {}
+        self.similar_cases = similar_cases
+
+    def predictions(self, k, kb):
+        ranking = self.rankings.get(k)
+        if ranking is None:
+            ranking = self.rankings[k] = predict_top_k(self.symptoms, k, kb)
+        return ranking
+
+class PredictionCache:
+    """Bounded LRU cache of predictions shared by /predict and /api/predict.
+
+    Entries are keyed by the sorted, deduplicated symptoms that the model,
+    the rules or the similarity index know, so requests differing only in
+    order, repeats or unknown names share one. Everything is dropped when
+    the knowledge base, rule or model version changes; a request still
+    holding a replaced knowledge base bypasses the cache.
+    """
+
+    def __init__(self, name, size=PREDICTION_CACHE_SIZE):
+        self.name = name
+        self.size = size
+        self._entries = OrderedDict()
+        self._version = None
+        self._known = frozenset()
+        self._lock = threading.Lock()
+
+    def version_of(self, kb):
+        model = predictor
+        return kb.version, kb.rule_engine.version, model.version if model is not None else None
+
+    def vocabulary(self, kb):
+        """Every symptom name that can change a prediction"""
+        known = set(kb.symptoms_list)
+        known.update(kb.rule_engine.symptom_index)
+        known.update(kb.similarity_index.symptom_index)
+        if predictor is not None:
+            known.update(predictor.symptoms_dict)
+        return frozenset(known)
+
+    def lookup(self, selected_symptoms, kb=None):
+        """Return the CachedPrediction for a symptom set, computing it on a miss"""
+        kb = kb or knowledge_base
+        if self.size <= 0 or kb is not knowledge_base:
+            return self.compute(tuple(selected_symptoms), kb)
+
+        version = self.version_of(kb)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self.evict(len(self._entries), 'invalidated')
+                    self._entries.clear()
+                    self._known = self.vocabulary(kb)
+                    self._version = version
+        key = tuple(sorted({s for s in selected_symptoms if s in self._known}))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        metrics.cache(self.name, entry is not None)
+        if entry is not None:
+            return entry
+
+        entry = self.compute(key, kb)
+        with self._lock:
+            if self._version == version:
+                self._entries[key] = entry
+                overflow = max(len(self._entries) - self.size, 0)
+                for _ in range(overflow):
+                    self._entries.popitem(last=False)
+                self.evict(overflow, 'capacity')
+            metrics.set('medrec_cache_entries', (('cache', self.name),), len(self._entries))
+        return entry
+
+    def compute(self, symptoms, kb):
+        return CachedPrediction(symptoms, kb.similarity_index.query(symptoms, distinct=True))
+
+    def evict(self, count, reason):
+        if count:
+            metrics.inc('medrec_cache_evictions_total', (('cache', self.name), ('reason', reason)), count)
+
+prediction_cache = PredictionCache('prediction')
+
+def encode_prediction_response(predictions, symptoms, record, similar_cases):
+    """Build the /api/predict body around a disease's pre-encoded info block"""
+    disease, confidence = predictions[0]
+    head = json_bytes({
+        'disease': disease,
+        'confidence': round(confidence, 2),
+        'symptoms': symptoms,
+    })
+    tail = json_bytes({
+        'predictions': [
+            {'disease': name, 'confidence': round(score, 2)}
+            for name, score in predictions
+        ]
+    })
+    return b''.join((
+        head[:-1], b',"info":',
+        record.info_json[:-1], b',"similar_cases":', json_bytes(similar_cases), b'},',
+        tail[1:],
+    ))
+
+def parse_batch_record(record, default_id):
+    """Return (record id, symptoms, error) for one batch prediction record"""
+    record_id = default_id
+    if isinstance(record, dict):
+        record_id = record.get('id', default_id)
+        symptoms = record.get('symptoms', [])
+    else:
+        symptoms = record
+    if not isinstance(symptoms, list) or not all(isinstance(s, str) for s in symptoms):
+        return record_id, None, 'Symptoms must be a list of strings'
+    if not symptoms:
+        return record_id, None, 'No symptoms provided'
+    return record_id, symptoms, None
+
+def parse_top_k(value):
+    """Return a requested top_k clamped to [1, MAX_TOP_K]; raises ValueError unless it is a whole number"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, str):
+        try:
+            value = int(value)
+        except ValueError:
+            pass
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError('top_k must be an integer')
+    return min(max(value, 1), MAX_TOP_K)
+
+def parse_accept_encoding(header):
+    """Return {coding: qvalue} from an Accept-Encoding header"""
+    codings = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding] = q
+    return codings
+
+class CachedPage:
+    """A rendered page kept as raw and pre-compressed bytes"""
+
+    # Preferred order when the client accepts several codings
+    encodings = ('br', 'gzip', 'deflate')
+
+    def __init__(self, body, version):
+        self.version = version
+        self.tag = hashlib.sha256(body).hexdigest()[:20]
+        self.variants = {
+            'identity': body,
+            'gzip': gzip.compress(body, 9, mtime=0),
+            'deflate': zlib.compress(body, 9),
+        }
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body)
+
+    def etag(self, encoding):
+        # Each encoding is a different representation, so it gets its own tag
+        if encoding == 'identity':
+            return f'"{self.tag}"'
+        return f'"{self.tag}-{encoding}"'
+
+    def matches(self, if_none_match):
+        """True when an If-None-Match header names any representation of this page"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        for candidate in if_none_match.split(','):
+            candidate = candidate.strip()
+            if candidate.startswith('W/'):
+                candidate = candidate[2:]
+            if candidate.strip('"').split('-')[0] == self.tag:
+                return True
+        return False
+
+    def select(self, accept_encoding):
+        """Pick the best available encoding for an Accept-Encoding header"""
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get('*', 0)
+        best = None
+        for encoding in self.encodings:
+            if encoding not in self.variants:
+                continue
+            q = accepted.get(encoding, wildcard)
+            if q > 0 and (best is None or q > best[1]):
+                best = (encoding, q)
+        if best is None:
+            return 'identity', self.variants['identity']
+        return best[0], self.variants[best[0]]
+
+class PageCache:
+    """Holds one CachedPage, rebuilt when the data version changes"""
+
+    def __init__(self, name):
+        self.name = name
+        self._page = None
+        self._lock = threading.Lock()
+
+    def get(self, version, render):
+        page = self._page
+        hit = page is not None and page.version == version
+        metrics.cache(self.name, hit)
+        if hit:
+            return page
+        with self._lock:
+            page = self._page
+            if page is None or page.version != version:
+                page = CachedPage(render().encode(), version)
+                self._page = page
+            return page
+
+index_page_cache = PageCache('index_page')
+
+class FileRegion:
+    """A byte range of a file, sent with sendfile instead of being read into memory"""
+
+    __slots__ = ('path', 'offset', 'count')
+
+    def __init__(self, path, offset, count):
+        self.path = path
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def slice(self, start, end):
+        return FileRegion(self.path, self.offset + start, end - start + 1)
+
+class StaticAsset(CachedPage):
+    """A file under static/ and its pre-compressed variants.
+
+    Pre-compressed siblings (name.gz, name.br) are used when present;
+    otherwise small text files are gzipped once here. Each variant is bytes
+    when it fits in STATIC_MEMORY_LIMIT and a FileRegion otherwise. ETags
+    and encoding negotiation come from CachedPage.
+    """
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b''):
+                digest.update(block)
+        digest = digest.hexdigest()
+        self.tag = self.version = digest[:20]
+        head, ext = os.path.splitext(name)
+        self.fingerprinted_name = f"{head}.{digest[:12]}{ext}"
+        self.content_type = (STATIC_CONTENT_TYPES.get(ext.lower())
+                             or mimetypes.guess_type(name)[0] or 'application/octet-stream')
+
+        self.variants = {'identity': self.load(path)}
+        self.size = len(self.variants['identity'])
+        for encoding, suffix in (('gzip', '.gz'), ('br', '.br')):
+            if os.path.exists(path + suffix):
+                self.variants[encoding] = self.load(path + suffix)
+        if ('gzip' not in self.variants and ext.lower() in STATIC_COMPRESSIBLE
+                and isinstance(self.variants['identity'], bytes)):
+            self.variants['gzip'] = gzip.compress(self.variants['identity'], 9, mtime=0)
+
+    @staticmethod
+    def load(path):
+        size = os.path.getsize(path)
+        if size > STATIC_MEMORY_LIMIT:
+            return FileRegion(path, 0, size)
+        with open(path, 'rb') as f:
+            return f.read()
+
+class StaticFiles:
+    """The files under the static directory, by plain and by fingerprinted name.
+
+    Only files found by scan() are served, so request paths never touch the
+    file system directly.
+    """
+
+    def __init__(self, root=STATIC_PATH):
+        self.root = root
+        self.assets = {}
+        self.routes = {}
+        # Set from --cdn-fallback: link vendor assets that are missing from their CDNs
+        self.cdn_fallback = False
+        self.scan()
+
+    def scan(self):
+        assets, routes = {}, {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(('.gz', '.br')) or filename.startswith('.'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                asset = StaticAsset(path, name)
+                assets[name] = asset
+                routes[name] = (asset, False)
+                routes[asset.fingerprinted_name] = (asset, True)
+        self.assets, self.routes = assets, routes
+
+    def lookup(self, name):
+        """Return (asset, immutable) for a name below /static/, or (None, False)"""
+        return self.routes.get(name, (None, False))
+
+    def url(self, name):
+        """Fingerprinted URL of a static file; when it is missing, its CDN copy with cdn_fallback"""
+        asset = self.assets.get(name)
+        if asset is not None:
+            return STATIC_URL + asset.fingerprinted_name
+        if self.cdn_fallback and name in VENDOR_ASSETS:
+            return VENDOR_ASSETS[name]
+        return STATIC_URL + name
+
+    def missing(self, names=VENDOR_ASSETS):
+        """Those of names that are not under the static root"""
+        return [name for name in names if name not in self.assets]
+
+static_files = StaticFiles()
+
+def parse_range(header, size):
+    """Parse a Range header into an inclusive (start, end) byte range.
+
+    Returns None when the header should be ignored (not bytes, malformed, or
+    several ranges, which are answered with the whole file) and raises
+    ValueError when the range lies outside the file.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = (part.strip() for part in spec.partition('-'))
+    if (not sep or not (first or last)
+            or (first and not first.isdigit()) or (last and not last.isdigit())):
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise ValueError("Unsatisfiable range")
+    return start, min(end, size - 1)
+
+def static_name(member):
+    """Name below static/ of a file in an asset archive, which may hold static/ itself"""
+    while member.startswith('./'):
+        member = member[2:]
+    return member[len('static/'):] if member.startswith('static/') else member
+
+def asset_reader(source, names):
+    """Return read(name, url) giving the bytes of a vendor asset.
+
+    With no source the asset is downloaded from url. Otherwise source is a
+    directory laid out like static/, or a .tar.gz, .tar or .zip archive of
+    static/vendor/ (or of static/) such as a release's asset archive, and
+    read raises FileNotFoundError for files it does not hold.
+    """
+    if source is None:
+        def download(name, url):
+            with urllib.request.urlopen(url, timeout=30) as response:
+                return response.read()
+        return download
+
+    if os.path.isdir(source):
+        def copy(name, url):
+            with open(os.path.join(source, *name.split('/')), 'rb') as f:
+                return f.read()
+        return copy
+
+    files = {}
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for member in archive.infolist():
+                name = static_name(member.filename)
+                if not member.is_dir() and name in names:
+                    files[name] = archive.read(member)
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            for member in archive.getmembers():
+                name = static_name(member.name)
+                if member.isfile() and name in names:
+                    files[name] = archive.extractfile(member).read()
+    else:
+        raise ValueError("not a directory, a .zip or a tar archive")
+
+    def unpack(name, url):
+        if name not in files:
+            raise FileNotFoundError(f"not in {source}")
+        return files[name]
+    return unpack
+
+def fetch_assets(root=STATIC_PATH, assets=VENDOR_ASSETS, source=None):
+    """Save the vendor assets into root and write their pre-compressed variants.
+
+    They are downloaded from their CDNs, or copied from source, see
+    asset_reader. Raises OSError, ValueError, tarfile.TarError or
+    zipfile.BadZipFile when source cannot be read at all.
+    """
+    read = asset_reader(source, assets)
+    ok = True
+    for name, url in assets.items():
+        path = os.path.join(root, *name.split('/'))
+        try:
+            data = read(name, url)
+        except OSError as e:
+            print(f"❌ {name}: {e}")
+            ok = False
+            continue
+
+        variants = [(path, data)]
+        if name.endswith(STATIC_COMPRESSIBLE):
+            variants.append((path + '.gz', gzip.compress(data, 9, mtime=0)))
+            if brotli is not None:
+                variants.append((path + '.br', brotli.compress(data)))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for variant_path, body in variants:
+            tmp_path = f"{variant_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, variant_path)
+        print(f"✅ {name} ({len(data):,} bytes)")
+    return ok
+
+def slot(name):
+    """Marker for a value filled into a pre-rendered page per request, see fill_page"""
+    return Markup(f'\x00{name}\x00')
+
+def fill_page(segments, values):
+    """Join a page pre-rendered by Templates.compile_page with the values of its slots"""
+    parts = list(segments)
+    for i in range(1, len(parts), 2):
+        parts[i] = values[parts[i]]
+    return ''.join(parts)
+
+class Templates:
+    """The Jinja2 templates in templates/, compiled once per process.
+
+    Compiled templates are kept by the environment and their bytecode is
+    cached under cache/templates, so restarts skip the compile step too.
+    Pages whose layout and content only change with the knowledge base are
+    rendered ahead with slot() markers for the per-request values and kept
+    as segments; serving them is then a string join. Fragments such as the
+    symptom grid are cached until their input changes.
+    """
+
+    def __init__(self, path=TEMPLATES_PATH, cache_path=TEMPLATE_CACHE_PATH):
+        try:
+            os.makedirs(cache_path, exist_ok=True)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(cache_path)
+        except OSError:
+            bytecode_cache = None
+        self.env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(path),
+            autoescape=jinja2.select_autoescape(('html',)),
+            bytecode_cache=bytecode_cache,
+            auto_reload=False,
+        )
+        self.env.globals['static_url'] = static_files.url
+        self._fragments = {}
+        self._pages = {}
+
+    @property
+    def macros(self):
+        """The macros of fragments.html"""
+        return self.env.get_template('fragments.html').module
+
+    def warm(self):
+        """Compile every template now rather than on the first request"""
+        for name in self.env.list_templates(extensions=('html',)):
+            self.env.get_template(name)
+
+    def render(self, name, **context):
+        return self.env.get_template(name).render(**context)
+
+    def compile_page(self, name, **context):
+        """Render a template, returning alternating static segments and slot names"""
+        return tuple(self.render(name, **context).split('\x00'))
+
+    def page(self, key, name, **context):
+        """compile_page, cached under key for the life of the process"""
+        segments = self._pages.get(key)
+        if segments is None:
+            segments = self._pages[key] = self.compile_page(name, **context)
+        return segments
+
+    def fragment(self, name, key, render):
+        """Return render(), cached until the key given for name changes"""
+        entry = self._fragments.get(name)
+        hit = entry is not None and entry[0] == key
+        metrics.cache('fragment', hit)
+        if not hit:
+            entry = (key, render())
+            self._fragments[name] = entry
+        return entry[1]
+
+templates = Templates()
+
+def compile_result_page(disease, info):
+    """Pre-render the result page of a disease with slots for the per-request values"""
+    return templates.compile_page(
+        'result.html', disease=disease, info=info, confidence=slot('confidence'),
+        symptom_badges=slot('symptoms'), alternatives=slot('alternatives'),
+        similar_cases=slot('similar_cases'))
+
+def build_result_pages(kb):
+    """Pre-render the result page of every disease in a knowledge base"""
+    return {
+        disease: compile_result_page(disease, get_disease_info(disease, kb=kb))
+        for disease in (record.name for record in kb.diseases if record.description)
+    }
+
 class MedicalRecommendationHandler(BaseHTTPRequestHandler):
+    # Socket timeout, so a client that stops sending or reading frees its thread; see --request-timeout
+    timeout = REQUEST_TIMEOUT
+    # Route label for metrics; set by track_request
+    route = None
+    status = None
+
     def do_GET(self):
         """Handle GET requests"""
         parsed_path = urlparse(self.path)
         path = parsed_path.path
 
         if path == '/' or path == '/index.html':
-            self.serve_index()
+            self.track_request('/', self.serve_index)
         elif path == '/symptoms':
-            self.serve_symptoms_api()
+            self.track_request('/symptoms', self.serve_symptoms_api)
+        elif path == '/metrics':
+            self.track_request('/metrics', self.serve_metrics)
+        elif path == '/healthz':
+            self.track_request('/healthz', self.serve_health)
+        elif path == '/readyz':
+            self.track_request('/readyz', self.serve_readiness)
+        elif path == '/admin/profile':
+            self.track_request('/admin/profile', self.serve_profile)
         elif path.startswith('/static/'):
-            self.serve_static_file(path)
+            self.track_request('/static', lambda: self.serve_static_file(path))
         else:
-            self.send_error(404)
+            self.track_request('unmatched', lambda: self.send_error(404))
+
+    def do_HEAD(self):
+        """Handle HEAD requests; send_body and the file routes skip the body"""
+        self.do_GET()
 
     def do_POST(self):
         """Handle POST requests"""
@@ -173,27 +1854,227 @@ class MedicalRecommendationHandler(BaseHTTPRequestHandler):
         path = parsed_path.path
 
         if path == '/predict':
-            self.handle_prediction()
+            self.track_request('/predict', self.handle_prediction)
         elif path == '/api/predict':
-            self.handle_api_prediction()
+            self.track_request('/api/predict', self.handle_api_prediction)
+        elif path == '/api/predict/batch':
+            self.track_request('/api/predict/batch', self.handle_batch_prediction)
+        elif path == '/admin/profile/reset':
+            self.track_request('/admin/profile/reset', self.reset_profile)
         else:
-            self.send_error(404)
+            self.track_request('unmatched', lambda: self.send_error(404))
+
+    def track_request(self, route, handle):
+        """Run a route, recording its latency, status and in-flight count.
+
+        route is the route pattern rather than the raw path so that unknown
+        URLs cannot blow up the number of label values.
+        """
+        self.route = route
+        self.status = None
+        in_flight = (('route', route),)
+        metrics.add('medrec_http_requests_in_flight', in_flight, 1)
+        start = time.perf_counter()
+        try:
+            # The profile endpoints themselves are never sampled
+            if profiler is not None and not route.startswith('/admin/'):
+                profiler.run(route, handle)
+            else:
+                handle()
+        except Exception as e:
+            self.count_error(e)
+            raise
+        finally:
+            metrics.add('medrec_http_requests_in_flight', in_flight, -1)
+            metrics.observe('medrec_http_request_duration_seconds',
+                            (('route', route), ('method', self.command)),
+                            time.perf_counter() - start)
+            # A route that raised before responding counts as a server error
+            metrics.inc('medrec_http_requests_total',
+                        (('route', route), ('method', self.command), ('status', str(self.status or 500))))
+
+    def send_response(self, code, message=None):
+        self.status = code
+        super().send_response(code, message)
+
+    def count_error(self, error):
+        metrics.inc('medrec_errors_total', (('route', self.route), ('type', type(error).__name__)))
+
+    def count_prediction(self, disease):
+        metrics.inc('medrec_predictions_total', (('route', self.route), ('disease', disease)))
+
+    def serve_metrics(self):
+        """Serve the metrics in the Prometheus text format"""
+        record_memory_metrics()
+        self.send_body(200, METRICS_CONTENT_TYPE, metrics.render())
+
+    def serve_health(self):
+        """Liveness: the process is up and answering"""
+        self.send_body(200, 'application/json', b'{"status":"ok"}')
+
+    def serve_readiness(self):
+        """Readiness: 200 once startup has finished, 503 before, with the startup phase timings"""
+        kb, model = knowledge_base, predictor
+        is_ready = ready.is_set() and kb is not None
+        body = {
+            'status': 'ready' if is_ready else 'starting',
+            'knowledge_base': kb.version[:12] if kb is not None else None,
+            'model': model.version if model is not None else None,
+            'predictor': 'rules' if model is None else type(model.model).__name__,
+            'startup_ms': {name: round(seconds * 1000, 1) for name, seconds in startup_phases.items()},
+        }
+        self.send_body(200 if is_ready else 503, 'application/json', json_bytes(body))
+
+    def serve_profile(self):
+        """Serve the aggregated request profiles.
+
+        ?route= limits the report to one route, ?sort= takes any pstats sort
+        key and ?limit= the number of functions. ?format=pstats returns the
+        raw stats for loading with python -m pstats.
+        """
+        if profiler is None:
+            self.send_error(404, "Profiling is disabled, start the server with --profile-rate")
+            return
+        query = parse_qs(urlparse(self.path).query)
+        route = query.get('route', [None])[0]
+        if query.get('format', [''])[0] == 'pstats':
+            self.send_body(200, 'application/octet-stream', profiler.dump(route))
+            return
+        try:
+            report = profiler.report(route, query.get('sort', ['cumulative'])[0],
+                                     int(query.get('limit', [25])[0]))
+        except (KeyError, ValueError) as e:
+            self.send_body(400, 'text/plain; charset=utf-8', f"Invalid profile query: {e}\n".encode())
+            return
+        self.send_body(200, 'text/plain; charset=utf-8', report.encode())
+
+    def reset_profile(self):
+        """Discard the aggregated request profiles"""
+        if profiler is None:
+            self.send_error(404, "Profiling is disabled, start the server with --profile-rate")
+            return
+        profiler.reset()
+        self.send_body(200, 'text/plain; charset=utf-8', b'Profiles cleared\n')
+
+    def send_body(self, status, content_type, body):
+        """Send a complete response with a Content-Length header"""
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
 
     def serve_index(self):
-        """Serve the main index page"""
-        html_content = self.generate_index_html()
+        """Serve the main index page from the pre-compressed cache"""
+        kb = knowledge_base
+        page = index_page_cache.get(kb.version, lambda: self.generate_index_html(kb))
+        encoding, body = page.select(self.headers.get('Accept-Encoding'))
+
+        if page.matches(self.headers.get('If-None-Match')):
+            self.send_response(304)
+            self.send_header('ETag', page.etag(encoding))
+            self.send_header('Cache-Control', INDEX_CACHE_CONTROL)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
         self.send_response(200)
-        self.send_header('Content-type', 'text/html')
+        self.send_header('Content-type', 'text/html; charset=utf-8')
+        if encoding != 'identity':
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', page.etag(encoding))
+        self.send_header('Cache-Control', INDEX_CACHE_CONTROL)
+        self.send_header('Vary', 'Accept-Encoding')
         self.end_headers()
-        self.wfile.write(html_content.encode())
+        if self.command != 'HEAD':
+            self.wfile.write(body)
 
-    def serve_symptoms_api(self):
-        """Serve symptoms API"""
-        response = {'symptoms': sorted(symptoms_list)}
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
+    def serve_static_file(self, path):
+        """Serve a file under static/ with validators, compression and Range support"""
+        asset, immutable = static_files.lookup(path[len(STATIC_URL):])
+        if asset is None:
+            self.send_error(404)
+            return
+        cache_control = STATIC_IMMUTABLE_CACHE_CONTROL if immutable else STATIC_CACHE_CONTROL
+
+        if asset.matches(self.headers.get('If-None-Match')):
+            self.send_response(304)
+            self.send_header('ETag', asset.etag('identity'))
+            self.send_header('Cache-Control', cache_control)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if range_header and if_range and if_range.strip() != asset.etag('identity'):
+            # The client's partial copy is stale; send the whole file
+            range_header = None
+        byte_range = None
+        if range_header:
+            try:
+                byte_range = parse_range(range_header, asset.size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{asset.size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+        if byte_range is not None:
+            # Ranges address the identity representation
+            encoding, body = 'identity', asset.variants['identity']
+            start, end = byte_range
+            body = body[start:end + 1] if isinstance(body, bytes) else body.slice(start, end)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{asset.size}')
+        else:
+            encoding, body = asset.select(self.headers.get('Accept-Encoding'))
+            self.send_response(200)
+
+        self.send_header('Content-type', asset.content_type)
+        if encoding != 'identity':
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', asset.etag(encoding))
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Accept-Ranges', 'bytes')
         self.end_headers()
-        self.wfile.write(json.dumps(response).encode())
+        if self.command == 'HEAD':
+            return
+        if isinstance(body, FileRegion):
+            self.send_file_region(body)
+        else:
+            self.wfile.write(body)
+
+    def send_file_region(self, region):
+        """Send part of a file straight from the page cache.
+
+        socket.sendfile uses the zero-copy os.sendfile where the platform
+        has it and falls back to plain sends elsewhere.
+        """
+        self.wfile.flush()
+        with open(region.path, 'rb') as f:
+            self.connection.sendfile(f, region.offset, region.count)
+
+    def serve_symptoms_api(self):
+        """Serve the sorted symptom list, or with ?q= the ranked typeahead matches (optional ?limit=)"""
+        kb = knowledge_base
+        query = parse_qs(urlparse(self.path).query, keep_blank_values=True)
+        if 'q' not in query:
+            self.send_body(200, 'application/json', kb.symptoms_json)
+            return
+        try:
+            limit = min(max(int(query.get('limit', [TYPEAHEAD_LIMIT])[0]), 1), MAX_TYPEAHEAD_LIMIT)
+        except ValueError:
+            self.send_body(400, 'application/json', json_bytes({'error': 'limit must be an integer'}))
+            return
+        text = query['q'][0]
+        matches = symptom_search(kb).search(text, limit)
+        self.send_body(200, 'application/json', json_bytes({'query': text, 'symptoms': matches}))
 
     def handle_prediction(self):
         """Handle form-based prediction"""
@@ -203,30 +2084,31 @@ class MedicalRecommendationHandler(BaseHTTPRequestHandler):
             form_data = parse_qs(post_data)
 
             selected_symptoms = form_data.get('symptoms', [])
+            kb = knowledge_base
 
             if not selected_symptoms:
                 html_content = self.generate_result_html(error="Please select at least one symptom.")
             else:
-                disease, confidence = predict_disease(selected_symptoms)
-                disease_info = get_disease_info(disease)
+                cached = prediction_cache.lookup(selected_symptoms, kb)
+                predictions = cached.predictions(TOP_K, kb)
+                disease, confidence = predictions[0]
+                self.count_prediction(disease)
+                disease_info = dict(get_disease_info(disease, kb=kb), similar_cases=cached.similar_cases)
                 html_content = self.generate_result_html(
                     disease=disease,
                     confidence=round(confidence, 2),
                     symptoms=selected_symptoms,
-                    info=disease_info
+                    info=disease_info,
+                    alternatives=predictions[1:],
+                    kb=kb
                 )
 
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(html_content.encode())
+            self.send_body(200, 'text/html', html_content.encode())
 
         except Exception as e:
-            html_content = self.generate_result_html(error=f"An error occurred: {str(e)}")
-            self.send_response(500)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(html_content.encode())
+            self.count_error(e)
+            html_content = self.generate_error_html(f"An error occurred: {str(e)}")
+            self.send_body(500, 'text/html', html_content.encode())
 
     def handle_api_prediction(self):
         """Handle API-based prediction"""
@@ -234,371 +2116,857 @@ class MedicalRecommendationHandler(BaseHTTPRequestHandler):
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length).decode('utf-8')
             data = json.loads(post_data)
+            if not isinstance(data, dict):
+                self.send_body(400, 'application/json', json_bytes({'error': 'Expected a JSON object'}))
+                return
+
+            # Validated like a batch record, so only lists of strings reach the predictors
+            _, selected_symptoms, error = parse_batch_record(data, None)
+            if error is not None:
+                self.send_body(400, 'application/json', json_bytes({'error': error}))
+                return
+            try:
+                top_k = parse_top_k(data.get('top_k', TOP_K))
+            except ValueError as e:
+                self.send_body(400, 'application/json', json_bytes({'error': str(e)}))
+                return
+            kb = knowledge_base
+
+            cached = prediction_cache.lookup(selected_symptoms, kb)
+            predictions = cached.predictions(top_k, kb)
+            self.count_prediction(predictions[0][0])
+            record = kb.get_disease(predictions[0][0]) or EMPTY_DISEASE
+            body = encode_prediction_response(predictions, selected_symptoms, record, cached.similar_cases)
+            self.send_body(200, 'application/json', body)
 
-            selected_symptoms = data.get('symptoms', [])
+        except Exception as e:
+            self.count_error(e)
+            self.send_body(500, 'application/json', json_bytes({'error': str(e)}))
+
+    def iter_batch_records(self, content_length):
+        """Yield (record id, symptoms, error) for each record in a batch request.
+
+        NDJSON bodies are read line by line so large uploads are never held
+        in memory at once; JSON bodies are an array of records or an object
+        with a "records" array. A record is a list of symptoms or an object
+        with "symptoms" and an optional "id".
+        """
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type in NDJSON_CONTENT_TYPES:
+            remaining = content_length
+            line_number = 0
+            while remaining > 0:
+                line = self.rfile.readline(remaining)
+                if not line:
+                    break
+                remaining -= len(line)
+                line_number += 1
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield line_number, None, f"Invalid JSON: {e}"
+                    continue
+                yield parse_batch_record(record, line_number)
+        else:
+            data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+            records = data.get('records') if isinstance(data, dict) else data
+            if not isinstance(records, list):
+                raise ValueError("Expected a JSON array of records or an object with a 'records' array")
+            for index, record in enumerate(records):
+                yield parse_batch_record(record, index)
+
+    def handle_batch_prediction(self):
+        """Handle batch prediction, streaming one NDJSON result line per record"""
+        try:
+            content_length = int(self.headers['Content-Length'])
+            query = parse_qs(urlparse(self.path).query)
+            top_k = parse_top_k(query.get('top_k', [TOP_K])[0])
+            records = self.iter_batch_records(content_length)
+            # Pull the first record now so a malformed body still gets a 400
+            first = next(records, None)
+        except Exception as e:
+            self.count_error(e)
+            self.send_body(400, 'application/json', json_bytes({'error': str(e)}))
+            return
 
-            if not selected_symptoms:
-                response = {'error': 'No symptoms provided'}
-                self.send_response(400)
-            else:
-                disease, confidence = predict_disease(selected_symptoms)
-                disease_info = get_disease_info(disease)
-                response = {
-                    'disease': disease,
-                    'confidence': round(confidence, 2),
-                    'symptoms': selected_symptoms,
-                    'info': disease_info
-                }
-                self.send_response(200)
-
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(response).encode())
+        # The body length is unknown up front; the connection close ends it
+        self.send_response(200)
+        self.send_header('Content-type', 'application/x-ndjson')
+        self.end_headers()
+        if first is None:
+            return
 
+        records = itertools.chain([first], records)
+        kb = knowledge_base
+        try:
+            while True:
+                chunk = list(itertools.islice(records, BATCH_CHUNK_SIZE))
+                if not chunk:
+                    break
+                symptom_sets = [symptoms for _, symptoms, error in chunk if error is None]
+                results = iter(predict_top_k_batch(symptom_sets, top_k, kb))
+
+                lines = []
+                for record_id, symptoms, error in chunk:
+                    if error is not None:
+                        lines.append(json_bytes({'id': record_id, 'error': error}))
+                        continue
+                    predictions = next(results)
+                    disease, confidence = predictions[0]
+                    self.count_prediction(disease)
+                    lines.append(json_bytes({
+                        'id': record_id,
+                        'disease': disease,
+                        'confidence': round(confidence, 2),
+                        'predictions': [
+                            {'disease': name, 'confidence': round(score, 2)}
+                            for name, score in predictions
+                        ]
+                    }))
+                lines.append(b'')
+                self.wfile.write(b'\n'.join(lines))
         except Exception as e:
-            response = {'error': str(e)}
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(response).encode())
+            self.count_error(e)
+            # Headers are already sent; report the failure in the stream
+            self.wfile.write(json_bytes({'error': str(e)}) + b'\n')
 
-    def generate_index_html(self):
+    def generate_index_html(self, kb=None):
         """Generate the main index HTML page"""
-        symptoms_checkboxes = ""
-        for i, symptom in enumerate(sorted(symptoms_list)):
-            symptom_display = symptom.replace('_', ' ').title()
-            symptoms_checkboxes += f'''
-            <div class="col-md-4 col-sm-6 symptom-checkbox">
-                <div class="form-check">
-                    <input class="form-check-input" type="checkbox"
-                           name="symptoms" value="{symptom}" id="symptom_{i}">
-                    <label class="form-check-label" for="symptom_{i}">
-                        {symptom_display}
-                    </label>
-                </div>
-            </div>
-            '''
-
-        return f'''
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Personalized Medicine Recommendation System</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-    <link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css" rel="stylesheet">
-    <style>
-        body {{
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-        }}
-        .main-container {{
-            background: rgba(255, 255, 255, 0.95);
-            border-radius: 15px;
-            box-shadow: 0 15px 35px rgba(0, 0, 0, 0.1);
-            backdrop-filter: blur(10px);
-            margin: 20px auto;
-            padding: 30px;
-        }}
-        .header {{
-            text-align: center;
-            margin-bottom: 30px;
-            color: #333;
-        }}
-        .header h1 {{
-            color: #667eea;
-            font-weight: 700;
-            margin-bottom: 10px;
-        }}
-        .btn-primary {{
-            background: linear-gradient(45deg, #667eea, #764ba2);
-            border: none;
-            border-radius: 25px;
-            padding: 12px 30px;
-            font-weight: 600;
-        }}
-        .card {{
-            border: none;
-            border-radius: 15px;
-            box-shadow: 0 5px 15px rgba(0, 0, 0, 0.08);
-        }}
-        .card-header {{
-            background: linear-gradient(45deg, #667eea, #764ba2);
-            color: white;
-            border-radius: 15px 15px 0 0 !important;
-            font-weight: 600;
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="main-container">
-            <div class="header">
-                <h1><i class="fas fa-stethoscope"></i> Personalized Medicine Recommendation System</h1>
-                <p>AI-powered disease prediction and personalized treatment recommendations</p>
-            </div>
-
-            <div class="row">
-                <div class="col-md-12">
-                    <div class="card">
-                        <div class="card-header">
-                            <h4><i class="fas fa-clipboard-list"></i> Select Your Symptoms</h4>
-                            <small>Choose all symptoms you are currently experiencing</small>
-                        </div>
-                        <div class="card-body">
-                            <form method="POST" action="/predict">
-                                <div class="row">
-                                    {symptoms_checkboxes}
-                                </div>
-                                <div class="text-center mt-4">
-                                    <button type="submit" class="btn btn-primary btn-lg">
-                                        <i class="fas fa-diagnoses"></i> Get Diagnosis & Recommendations
-                                    </button>
-                                </div>
-                            </form>
-                        </div>
-                    </div>
-                </div>
-            </div>
-
-            <div class="footer text-center mt-4">
-                <p><i class="fas fa-info-circle"></i> This system is for educational purposes only. Always consult with healthcare professionals for medical advice.</p>
-            </div>
-        </div>
-    </div>
-
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js"></script>
-</body>
-</html>
-        '''
-
-    def generate_result_html(self, disease=None, confidence=None, symptoms=None, info=None, error=None):
-        """Generate the result HTML page"""
+        kb = kb or knowledge_base
+        # The grid only changes with the symptom vocabulary, not with every data reload
+        grid = templates.fragment('symptom_grid', kb.symptoms_list,
+                                  lambda: templates.macros.symptom_grid(sorted(kb.symptoms_list)))
+        return templates.render('index.html', symptom_grid=grid)
+
+    def generate_result_html(self, disease=None, confidence=None, symptoms=None, info=None, error=None,
+                             alternatives=None, kb=None):
+        """Generate the result HTML page.
+
+        Diseases in the knowledge base use the page pre-rendered by
+        build_result_pages, so only the confidence, the symptom badges, the
+        runner-up predictions and the similar cases are rendered here; the
+        rest of info is only rendered for diseases outside it.
+        """
         if error:
-            content = f'''
-            <div class="alert alert-danger" role="alert">
-                <i class="fas fa-exclamation-triangle"></i> {html.escape(error)}
-            </div>
-            <div class="text-center">
-                <a href="/" class="btn btn-primary">
-                    <i class="fas fa-arrow-left"></i> Try Again
-                </a>
-            </div>
-            '''
+            segments = templates.page('result_error', 'result.html', error=slot('error'))
+            return fill_page(segments, {'error': escape(error)})
+
+        kb = kb or knowledge_base
+        segments = kb.result_page_segments.get(disease)
+        metrics.cache('result_page', segments is not None)
+        if segments is None:
+            segments = compile_result_page(disease, info)
+        macros = templates.macros
+        # One pre-rendered badge per known symptom; a macro call per badge is the slow part
+        badges = templates.fragment('symptom_badges', kb.symptoms_list, lambda: {
+            symptom: macros.symptom_badges((symptom,)) for symptom in kb.symptoms_list
+        })
+        return fill_page(segments, {
+            'confidence': str(confidence),
+            'symptoms': ''.join(badges.get(symptom) or macros.symptom_badges((symptom,))
+                                for symptom in symptoms or ()),
+            'alternatives': macros.alternatives(alternatives),
+            'similar_cases': macros.similar_cases((info or {}).get('similar_cases')),
+        })
+
+    def generate_error_html(self, error):
+        """Generate the page shown when handling a request failed"""
+        segments = templates.page('error', 'error.html', error=slot('error'))
+        return fill_page(segments, {'error': escape(error)})
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """HTTPServer that hands each connection to a bounded pool of worker threads"""
+
+    def __init__(self, server_address, handler_class, threads=8, queue_size=64,
+                 bind_and_activate=True):
+        # request_queue_size is the listen() backlog used by server_activate
+        self.request_queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='medrec')
+        # Bound the connections waiting for a thread; when full, accept() stalls
+        # and further clients queue up in the kernel backlog instead of in memory
+        self._slots = threading.BoundedSemaphore(threads + queue_size)
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            self._executor.submit(self.process_request_thread, request, client_address)
+        except RuntimeError:
+            # Executor already shut down
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False)
+
+
+class BufferedRequestHandler(MedicalRecommendationHandler):
+    """Runs the MedicalRecommendationHandler routes against an in-memory request.
+
+    Used by the asyncio front end: the request has already been read off the
+    connection, and the response is captured instead of written to a socket
+    so the server can frame it for a persistent connection.
+    """
+
+    def __init__(self, command, path, request_version, headers, body, client_address):
+        # BaseHTTPRequestHandler.__init__ drives a socket, so set up the state by hand
+        self.command = command
+        self.path = path
+        self.request_version = request_version
+        self.requestline = f"{command} {path} {request_version}"
+        self.headers = headers
+        self.client_address = client_address
+        self.rfile = io.BytesIO(body)
+        self.wfile = io.BytesIO()
+        self.close_connection = False
+        self.status = 200
+        self.response_headers = []
+        self.file_region = None
+
+    def send_response(self, code, message=None):
+        self.log_request(code)
+        self.status = code
+
+    def send_header(self, keyword, value):
+        # Framing headers are owned by the asyncio server
+        if keyword.lower() not in ('content-length', 'connection'):
+            self.response_headers.append((keyword, value))
+
+    def end_headers(self):
+        pass
+
+    def send_file_region(self, region):
+        # Left for the asyncio server to send with loop.sendfile
+        self.file_region = region
+
+    def dispatch(self):
+        """Run the route for this request and return (status, headers, body).
+
+        HEAD is answered by the GET route; the server drops the body but keeps
+        its length for the Content-Length header.
+        """
+        if self.command in ('GET', 'HEAD'):
+            self.command = 'GET'
+            self.do_GET()
+        elif self.command == 'POST':
+            self.do_POST()
         else:
-            symptoms_badges = ""
-            if symptoms:
-                for symptom in symptoms:
-                    symptom_display = symptom.replace('_', ' ').title()
-                    symptoms_badges += f'<span class="badge bg-primary mb-2 me-2">{symptom_display}</span>'
-
-            medications_list = ""
-            if info and info.get('medications'):
-                for med in info['medications']:
-                    medications_list += f'<li class="list-group-item"><i class="fas fa-capsules text-primary me-2"></i>{html.escape(med)}</li>'
-
-            diet_list = ""
-            if info and info.get('diet'):
-                for diet_item in info['diet']:
-                    diet_list += f'<li class="list-group-item"><i class="fas fa-leaf text-success me-2"></i>{html.escape(diet_item)}</li>'
-
-            precautions_list = ""
-            if info and info.get('precautions'):
-                for precaution in info['precautions']:
-                    precautions_list += f'<li class="list-group-item"><i class="fas fa-exclamation-triangle text-warning me-2"></i>{html.escape(precaution)}</li>'
-
-            workouts_list = ""
-            if info and info.get('workouts'):
-                for workout in info['workouts']:
-                    workouts_list += f'<li class="list-group-item"><i class="fas fa-running text-info me-2"></i>{html.escape(workout)}</li>'
-
-            content = f'''
-            <div class="row">
-                <div class="col-md-12">
-                    <div class="card mb-4">
-                        <div class="card-header bg-success text-white">
-                            <h4><i class="fas fa-diagnoses"></i> Diagnosis Result</h4>
-                        </div>
-                        <div class="card-body">
-                            <div class="row">
-                                <div class="col-md-8">
-                                    <h3 class="text-success">{html.escape(disease or 'Unknown')}</h3>
-                                    <p class="lead">Based on your symptoms, our system predicts this condition with <strong>{confidence}% confidence</strong>.</p>
-
-                                    {f'<div class="mt-3"><h5><i class="fas fa-info-circle"></i> Description</h5><p class="text-muted">{html.escape(info.get("description", ""))}</p></div>' if info and info.get('description') else ''}
-                                </div>
-                                <div class="col-md-4">
-                                    <div class="text-center">
-                                        <div class="progress mb-3" style="height: 20px;">
-                                            <div class="progress-bar bg-success" role="progressbar"
-                                                 style="width: {confidence}%" aria-valuenow="{confidence}"
-                                                 aria-valuemin="0" aria-valuemax="100">
-                                                {confidence}%
-                                            </div>
-                                        </div>
-                                        <small class="text-muted">Prediction Confidence</small>
-                                    </div>
-                                </div>
-                            </div>
-
-                            <div class="mt-4">
-                                <h5><i class="fas fa-list-check"></i> Your Selected Symptoms</h5>
-                                <div class="row">
-                                    {symptoms_badges}
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-
-            <div class="row">
-                {f'<div class="col-md-6 mb-4"><div class="card h-100"><div class="card-header"><h5><i class="fas fa-pills"></i> Recommended Medications</h5></div><div class="card-body"><ul class="list-group list-group-flush">{medications_list}</ul></div></div></div>' if medications_list else ''}
-
-                {f'<div class="col-md-6 mb-4"><div class="card h-100"><div class="card-header"><h5><i class="fas fa-utensils"></i> Dietary Recommendations</h5></div><div class="card-body"><ul class="list-group list-group-flush">{diet_list}</ul></div></div></div>' if diet_list else ''}
-            </div>
-
-            <div class="row">
-                {f'<div class="col-md-6 mb-4"><div class="card h-100"><div class="card-header"><h5><i class="fas fa-shield-alt"></i> Precautions</h5></div><div class="card-body"><ul class="list-group list-group-flush">{precautions_list}</ul></div></div></div>' if precautions_list else ''}
-
-                {f'<div class="col-md-6 mb-4"><div class="card h-100"><div class="card-header"><h5><i class="fas fa-dumbbell"></i> Exercise Recommendations</h5></div><div class="card-body"><ul class="list-group list-group-flush">{workouts_list}</ul></div></div></div>' if workouts_list else ''}
-            </div>
-
-            <div class="row">
-                <div class="col-md-12">
-                    <div class="card">
-                        <div class="card-body text-center">
-                            <a href="/" class="btn btn-primary me-3">
-                                <i class="fas fa-redo"></i> New Diagnosis
-                            </a>
-                            <button class="btn btn-success" onclick="window.print()">
-                                <i class="fas fa-print"></i> Print Results
-                            </button>
-                        </div>
-                    </div>
-                </div>
-            </div>
-
-            <div class="row mt-4">
-                <div class="col-md-12">
-                    <div class="alert alert-warning" role="alert">
-                        <h5><i class="fas fa-exclamation-triangle"></i> Important Medical Disclaimer</h5>
-                        <p class="mb-0">
-                            This system is designed for educational and informational purposes only.
-                            The predictions and recommendations provided should not replace professional medical advice,
-                            diagnosis, or treatment. Always consult with qualified healthcare professionals for proper
-                            medical evaluation and treatment decisions.
-                        </p>
-                    </div>
-                </div>
-            </div>
-            '''
-
-        return f'''
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Diagnosis Results - Personalized Medicine System</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-    <link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css" rel="stylesheet">
-    <style>
-        body {{
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-        }}
-        .main-container {{
-            background: rgba(255, 255, 255, 0.95);
-            border-radius: 15px;
-            box-shadow: 0 15px 35px rgba(0, 0, 0, 0.1);
-            backdrop-filter: blur(10px);
-            margin: 20px auto;
-            padding: 30px;
-        }}
-        .header {{
-            text-align: center;
-            margin-bottom: 30px;
-            color: #333;
-        }}
-        .header h1 {{
-            color: #667eea;
-            font-weight: 700;
-            margin-bottom: 10px;
-        }}
-        .btn-primary {{
-            background: linear-gradient(45deg, #667eea, #764ba2);
-            border: none;
-            border-radius: 25px;
-            padding: 12px 30px;
-            font-weight: 600;
-        }}
-        .card {{
-            border: none;
-            border-radius: 15px;
-            box-shadow: 0 5px 15px rgba(0, 0, 0, 0.08);
-        }}
-        .card-header {{
-            background: linear-gradient(45deg, #667eea, #764ba2);
-            color: white;
-            border-radius: 15px 15px 0 0 !important;
-            font-weight: 600;
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="main-container">
-            <div class="header">
-                <h1><i class="fas fa-stethoscope"></i> Personalized Medicine Recommendation System</h1>
-                <p>AI-powered disease prediction and personalized treatment recommendations</p>
-            </div>
-
-            {content}
-
-            <div class="footer text-center mt-4">
-                <p><i class="fas fa-info-circle"></i> This system is for educational purposes only. Always consult with healthcare professionals for medical advice.</p>
-            </div>
-        </div>
-    </div>
-
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js"></script>
-</body>
-</html>
-        '''
-
-
-def main():
+            self.send_error(501, f"Unsupported method ({self.command!r})")
+        if self.file_region is not None:
+            return self.status, self.response_headers, self.file_region
+        return self.status, self.response_headers, self.wfile.getvalue()
+
+
+class LoopReader:
+    """File-like reader of a request body still on an asyncio connection.
+
+    Called from a pool thread; each read is run on the event loop and waited
+    for, taking at most chunk_size bytes and never more than the body holds.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, reader, loop, length, timeout, buffered=b''):
+        self.reader = reader
+        self.loop = loop
+        self.remaining = length
+        self.timeout = timeout
+        self.buffer = bytearray(buffered)
+
+    def fill(self):
+        """Read the next piece of the body into the buffer; False once it is all read"""
+        if self.remaining <= 0:
+            return False
+        read = asyncio.wait_for(self.reader.read(min(self.chunk_size, self.remaining)), self.timeout)
+        data = asyncio.run_coroutine_threadsafe(read, self.loop).result()
+        if not data:
+            raise ConnectionError("Connection closed in the middle of the request body")
+        self.remaining -= len(data)
+        self.buffer += data
+        return True
+
+    def take(self, size):
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def read(self, size=-1):
+        while (size < 0 or len(self.buffer) < size) and self.fill():
+            pass
+        return self.take(len(self.buffer) if size < 0 else size)
+
+    def readline(self, size=-1):
+        while b'\n' not in self.buffer and (size < 0 or len(self.buffer) < size) and self.fill():
+            pass
+        end = self.buffer.find(b'\n') + 1 or len(self.buffer)
+        return self.take(end if size < 0 else min(end, size))
+
+    def exhausted(self):
+        return self.remaining <= 0 and not self.buffer
+
+
+class LoopWriter:
+    """File-like writer onto an asyncio connection, waiting for the client to keep up"""
+
+    def __init__(self, writer, loop, timeout):
+        self.writer = writer
+        self.loop = loop
+        self.timeout = timeout
+        self.chunked = False
+
+    def send(self, data):
+        async def write():
+            self.writer.write(data)
+            await self.writer.drain()
+        asyncio.run_coroutine_threadsafe(asyncio.wait_for(write(), self.timeout), self.loop).result()
+
+    def write(self, data):
+        # An empty chunk would end a chunked body
+        if data:
+            self.send(b'%x\r\n%b\r\n' % (len(data), data) if self.chunked else data)
+        return len(data)
+
+    def finish(self):
+        if self.chunked:
+            self.send(b'0\r\n\r\n')
+
+
+def response_head(status, headers, keep_alive):
+    """Encode a status line and headers for the asyncio server"""
+    reason = BaseHTTPRequestHandler.responses.get(status, ('',))[0]
+    head = [f"HTTP/1.1 {status} {reason}"]
+    head.extend(f"{k}: {v}" for k, v in headers)
+    head.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1')
+
+
+class StreamingRequestHandler(BufferedRequestHandler):
+    """Runs a streaming route such as /api/predict/batch on an asyncio connection.
+
+    The body is read from the connection while the route consumes it and
+    the response is written as the route produces it, chunked for HTTP/1.1
+    clients and ended by closing the connection for HTTP/1.0 ones, so memory
+    stays bounded however large the batch. body is the request body when it
+    already had to be read whole (chunked uploads), else None.
+    """
+
+    def __init__(self, command, path, request_version, headers, client_address, body,
+                 reader, writer, loop, timeout, keep_alive):
+        super().__init__(command, path, request_version, headers, b'', client_address)
+        if body is None:
+            self.rfile = LoopReader(reader, loop, int(headers.get('Content-Length') or 0), timeout)
+        else:
+            self.rfile = LoopReader(reader, loop, 0, timeout, body)
+        self.wfile = LoopWriter(writer, loop, timeout)
+        self.keep_alive = keep_alive
+        self.content_length = None
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'content-length':
+            self.content_length = value
+        super().send_header(keyword, value)
+
+    def end_headers(self):
+        headers = list(self.response_headers)
+        if self.content_length is not None:
+            headers.append(('Content-Length', self.content_length))
+        elif self.request_version == 'HTTP/1.1':
+            headers.append(('Transfer-Encoding', 'chunked'))
+        else:
+            self.close_connection = True
+        self.wfile.send(response_head(self.status, headers, self.keep_alive and not self.close_connection))
+        self.wfile.chunked = self.content_length is None and not self.close_connection
+
+    def dispatch(self):
+        """Run the route; returns whether the connection can take another request"""
+        self.do_POST()
+        self.wfile.finish()
+        # A route that stopped reading early leaves the rest of the body on the connection
+        return self.keep_alive and not self.close_connection and self.rfile.exhausted()
+
+
+class AsyncHTTPServer:
+    """HTTP/1.1 server on asyncio with keep-alive and pipelining.
+
+    Requests on a connection are read and answered strictly in order, so
+    pipelined requests are handled naturally. Idle connections cost only a
+    coroutine; a thread is borrowed from the pool only while a route runs.
+    """
+
+    max_header_bytes = 64 * 1024
+    max_body_bytes = 16 * 1024 * 1024
+    # Routes run with StreamingRequestHandler: bodies of any length, responses sent as produced
+    streaming_routes = frozenset({'/api/predict/batch'})
+
+    def __init__(self, threads=8, keepalive_timeout=15.0):
+        self.keepalive_timeout = keepalive_timeout
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='medrec')
+
+    async def read_head(self, reader):
+        """Read a request line and headers; returns None when the peer is done with the connection"""
+        while True:
+            request_line = await asyncio.wait_for(reader.readline(), self.keepalive_timeout)
+            if not request_line:
+                return None
+            # Tolerate stray CRLFs between pipelined requests (RFC 7230 3.5)
+            if request_line not in (b'\r\n', b'\n'):
+                break
+
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+            raise ValueError(f"Bad request line {request_line[:100]!r}")
+        command, path, version = parts
+
+        header_lines = []
+        size = 0
+        while True:
+            line = await reader.readline()
+            size += len(line)
+            if size > self.max_header_bytes:
+                raise ValueError("Request headers too large")
+            if line in (b'\r\n', b'\n', b''):
+                break
+            header_lines.append(line)
+        headers = http.client.parse_headers(io.BytesIO(b''.join(header_lines) + b'\r\n'))
+        return command, path, version, headers
+
+    async def read_body(self, reader, headers):
+        """Read a whole request body, of at most max_body_bytes"""
+        if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+            body = await self.read_chunked(reader)
+            # The routes read Content-Length bytes from rfile, so present the decoded body that way
+            del headers['Transfer-Encoding']
+            del headers['Content-Length']
+            headers['Content-Length'] = str(len(body))
+        else:
+            length = int(headers.get('Content-Length') or 0)
+            if length < 0 or length > self.max_body_bytes:
+                raise ValueError("Invalid Content-Length")
+            body = await reader.readexactly(length) if length else b''
+            if 'Content-Length' not in headers:
+                # Handlers read exactly Content-Length bytes from rfile
+                headers['Content-Length'] = '0'
+        return body
+
+    def streams(self, command, path):
+        return command == 'POST' and urlparse(path).path in self.streaming_routes
+
+    async def read_chunked(self, reader):
+        """Decode a chunked request body"""
+        chunks = []
+        total = 0
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                # Skip trailers
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                break
+            total += size
+            if total > self.max_body_bytes:
+                raise ValueError("Request body too large")
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        return b''.join(chunks)
+
+    def wants_keepalive(self, version, headers):
+        connection = headers.get('Connection', '').lower()
+        if version == 'HTTP/1.1':
+            return 'close' not in connection
+        return 'keep-alive' in connection
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername') or ('', 0)
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    request = await self.read_head(reader)
+                    if request is None:
+                        break
+                    command, path, version, headers = request
+                    streaming = self.streams(command, path)
+                    if not streaming or 'chunked' in headers.get('Transfer-Encoding', '').lower():
+                        body = await self.read_body(reader, headers)
+                    else:
+                        # Left on the connection for the route to read as it goes
+                        body = None
+                        if int(headers.get('Content-Length') or 0) < 0:
+                            raise ValueError("Invalid Content-Length")
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except ValueError as e:
+                    body = f"Bad request: {e}".encode()
+                    writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Type: text/plain\r\n'
+                                 b'Content-Length: %d\r\nConnection: close\r\n\r\n' % len(body) + body)
+                    await writer.drain()
+                    break
+
+                keep_alive = self.wants_keepalive(version, headers)
+                if streaming:
+                    handler = StreamingRequestHandler(command, path, version, headers, peer[:2], body,
+                                                      reader, writer, loop, self.keepalive_timeout, keep_alive)
+                    try:
+                        keep_alive = await loop.run_in_executor(self.executor, handler.dispatch)
+                    except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                        break
+                    if not keep_alive:
+                        break
+                    continue
+
+                handler = BufferedRequestHandler(command, path, version, headers, body, peer[:2])
+                status, response_headers, payload = await loop.run_in_executor(self.executor, handler.dispatch)
+                keep_alive = keep_alive and not handler.close_connection
+
+                if status >= 200 and status not in (204, 304):
+                    response_headers = response_headers + [('Content-Length', len(payload))]
+                head = response_head(status, response_headers, keep_alive)
+                if isinstance(payload, FileRegion):
+                    writer.write(head)
+                    if command != 'HEAD':
+                        with open(payload.path, 'rb') as f:
+                            await loop.sendfile(writer.transport, f, payload.offset, payload.count)
+                else:
+                    # One write per response keeps header and body in the same segment
+                    writer.write(head if command == 'HEAD' else head + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, sock):
+        server = await asyncio.start_server(self.handle_connection, sock=sock)
+        async with server:
+            await server.serve_forever()
+
+    def run(self, sock):
+        """Serve on an already listening socket until interrupted"""
+        try:
+            asyncio.run(self.serve(sock))
+        finally:
+            self.executor.shutdown(wait=False)
+
+
+def warm_caches(kb=None):
+    """Build what the first requests would otherwise build.
+
+    Compiles the templates, renders the index page and runs one prediction
+    through the prediction cache, which also faults in the pages of the
+    memory-mapped model.
+    """
+    kb = kb or knowledge_base
+    templates.warm()
+    handler = MedicalRecommendationHandler.__new__(MedicalRecommendationHandler)
+    index_page_cache.get(kb.version, lambda: handler.generate_index_html(kb))
+    prediction_cache.lookup(kb.symptoms_list[:1], kb).predictions(TOP_K, kb)
+
+
+def make_server(config, bind_and_activate=True):
+    """Create the HTTP server for the configured concurrency mode"""
+    server_address = (config.host, config.port)
+    if config.mode == 'single' or config.threads <= 1:
+        httpd = HTTPServer(server_address, MedicalRecommendationHandler, bind_and_activate=False)
+        httpd.request_queue_size = config.queue_size
+        if bind_and_activate:
+            try:
+                httpd.server_bind()
+                httpd.server_activate()
+            except Exception:
+                httpd.server_close()
+                raise
+        return httpd
+    return ThreadPoolHTTPServer(server_address, MedicalRecommendationHandler,
+                                threads=config.threads, queue_size=config.queue_size,
+                                bind_and_activate=bind_and_activate)
+
+
+def serve_prefork(serve, close, workers):
+    """Fork worker processes that all accept() on the already bound listening socket.
+
+    serve runs in each worker until it is killed; close releases the parent's
+    copy of the socket once every worker has exited.
+    """
+    children = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            # Worker: let the parent own shutdown, serve until killed
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                serve()
+            except Exception as e:
+                print(f"Worker {os.getpid()} crashed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = True
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.pop(pid, None)
+        if not stopping:
+            print(f"⚠️  Worker {pid} exited with status {status}, restarting")
+            spawn()
+
+    close()
+
+
+SERVER_MODES = ('single', 'threaded', 'prefork', 'async')
+
+
+def env_int(name, default):
+    """Read an integer setting from the environment"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Ignoring invalid {name}={value!r}")
+        return default
+
+
+def env_flag(name):
+    """Read an on/off setting from the environment: 1, true, yes or on"""
+    return os.environ.get(name, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+def env_float(name, default):
+    """Read a numeric setting from the environment"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"Ignoring invalid {name}={value!r}")
+        return default
+
+
+def parse_args(argv=None):
+    """Parse server settings from the command line, falling back to MEDREC_* environment variables"""
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description='Personalized Medicine Recommendation System server')
+    parser.add_argument('--host', default=os.environ.get('MEDREC_HOST', ''),
+                        help='Bind address (default: all interfaces, env MEDREC_HOST)')
+    parser.add_argument('--port', type=int, default=env_int('MEDREC_PORT', 8000),
+                        help='Bind port (default: 8000, env MEDREC_PORT)')
+    parser.add_argument('--mode', choices=SERVER_MODES,
+                        default=os.environ.get('MEDREC_MODE', 'threaded'),
+                        help='Concurrency mode (default: threaded, env MEDREC_MODE)')
+    parser.add_argument('--workers', type=int, default=env_int('MEDREC_WORKERS', cpu_count),
+                        help='Worker processes in prefork/async mode (default: CPU count, env MEDREC_WORKERS)')
+    parser.add_argument('--threads', type=int, default=env_int('MEDREC_THREADS', 8),
+                        help='Threads per process for running routes (default: 8, env MEDREC_THREADS)')
+    parser.add_argument('--reload-interval', type=float,
+                        default=env_float('MEDREC_RELOAD_INTERVAL', RELOAD_INTERVAL),
+                        help='Seconds between checks of the data files for hot reload, 0 disables '
+                             f'(default: {RELOAD_INTERVAL:g}, env MEDREC_RELOAD_INTERVAL)')
+    parser.add_argument('--compile-kb', action='store_true',
+                        help='Parse the CSV files, write the knowledge-base snapshot and exit')
+    parser.add_argument('--fetch-assets', action='store_true',
+                        help=f'Download Bootstrap and Font Awesome into {STATIC_PATH}/ for offline use and exit')
+    parser.add_argument('--install-assets', metavar='PATH',
+                        help=f'Install Bootstrap and Font Awesome into {STATIC_PATH}/ from an archive or copy of '
+                             f'{STATIC_PATH}/vendor/ made with --fetch-assets elsewhere, and exit')
+    parser.add_argument('--cdn-fallback', action='store_true', default=env_flag('MEDREC_CDN_FALLBACK'),
+                        help='Link Bootstrap and Font Awesome from their CDNs while they are missing from '
+                             f'{STATIC_PATH}/ (default: off, env MEDREC_CDN_FALLBACK)')
+    parser.add_argument('--keepalive-timeout', type=float, default=env_float('MEDREC_KEEPALIVE_TIMEOUT', 15),
+                        help='Idle keep-alive timeout in seconds for async mode (default: 15, env MEDREC_KEEPALIVE_TIMEOUT)')
+    parser.add_argument('--request-timeout', type=float,
+                        default=env_float('MEDREC_REQUEST_TIMEOUT', REQUEST_TIMEOUT),
+                        help='Seconds a connection may be idle or stalled before it is closed in single, '
+                             f'threaded and prefork mode (default: {REQUEST_TIMEOUT:g}, env MEDREC_REQUEST_TIMEOUT)')
+    parser.add_argument('--queue-size', type=int, default=env_int('MEDREC_QUEUE_SIZE', 64),
+                        help='Listen backlog and pending connection limit (default: 64, env MEDREC_QUEUE_SIZE)')
+    parser.add_argument('--profile-rate', type=float, default=env_float('MEDREC_PROFILE_RATE', 0),
+                        help='Fraction of requests to run under cProfile, reported at /admin/profile; '
+                             '0 disables (default: 0, env MEDREC_PROFILE_RATE)')
+    parser.add_argument('--prediction-cache-size', type=int,
+                        default=env_int('MEDREC_PREDICTION_CACHE_SIZE', PREDICTION_CACHE_SIZE),
+                        help='Distinct symptom sets whose predictions are cached per process, 0 disables '
+                             f'(default: {PREDICTION_CACHE_SIZE}, env MEDREC_PREDICTION_CACHE_SIZE)')
+    config = parser.parse_args(argv)
+
+    if config.mode not in SERVER_MODES:
+        parser.error(f"invalid MEDREC_MODE {config.mode!r}")
+    if config.mode == 'prefork' and not hasattr(os, 'fork'):
+        print("⚠️  Pre-fork mode needs os.fork(); falling back to threaded mode")
+        config.mode = 'threaded'
+    if config.mode == 'async' and not hasattr(os, 'fork'):
+        config.workers = 1
+    config.workers = max(1, config.workers)
+    config.threads = max(1, config.threads)
+    config.queue_size = max(1, config.queue_size)
+    # 0 or less means no timeout, as with socket.settimeout(None)
+    config.request_timeout = config.request_timeout if config.request_timeout > 0 else None
+    config.profile_rate = min(max(config.profile_rate, 0.0), 1.0)
+    return config
+
+
+def main(argv=None):
     """Main function to start the server"""
+    global profiler
+    config = parse_args(argv)
+
     print("🏥 Personalized Medicine Recommendation System")
     print("=" * 60)
 
+    if config.fetch_assets or config.install_assets:
+        try:
+            ok = fetch_assets(source=config.install_assets)
+        except (OSError, ValueError, tarfile.TarError, zipfile.BadZipFile) as e:
+            print(f"❌ Cannot read {config.install_assets}: {e}")
+            sys.exit(1)
+        if not ok:
+            print("❌ Some assets could not be installed; pages go without them unless the server runs with --cdn-fallback.")
+            sys.exit(1)
+        print(f"✅ Assets saved under {STATIC_PATH}/")
+        return
+
+    static_files.cdn_fallback = config.cdn_fallback
+    missing = static_files.missing()
+    if missing:
+        if config.cdn_fallback:
+            print(f"⚠️  {len(missing)} of {len(VENDOR_ASSETS)} vendor assets are missing from {STATIC_PATH}/; "
+                  f"pages link them from their CDNs")
+        else:
+            print(f"⚠️  {len(missing)} of {len(VENDOR_ASSETS)} vendor assets are missing from {STATIC_PATH}/, "
+                  f"so pages will be unstyled. Install them with --fetch-assets, or offline with "
+                  f"--install-assets <archive>, or run with --cdn-fallback")
+
+    if config.compile_kb:
+        if not load_csv_data(use_snapshot=False):
+            print("❌ Failed to load data files.")
+            sys.exit(1)
+        write_kb_snapshot(knowledge_base, KB_SNAPSHOT_PATH)
+        templates.warm()
+        print(f"✅ Knowledge-base snapshot written to {KB_SNAPSHOT_PATH}")
+        print(f"✅ Template bytecode cached in {TEMPLATE_CACHE_PATH}")
+        return
+
     # Load data
-    if not load_csv_data():
+    if not run_phase('csv_load', load_csv_data):
         print("❌ Failed to load data files.")
         return
 
-    print(f"✅ Loaded {len(symptoms_list)} symptoms")
-    print(f"✅ Loaded data for {len(description_data)} diseases")
+    print(f"✅ Loaded {len(knowledge_base.symptoms_list)} symptoms")
+    print(f"✅ Loaded data for {len(knowledge_base.diseases)} diseases")
+
+    run_phase('model_load', load_model_artifacts)
+    prediction_cache.size = config.prediction_cache_size
+    run_phase('cache_warmup', warm_caches)
+
+    if config.profile_rate > 0:
+        profiler = RequestProfiler(config.profile_rate)
 
     # Start server
-    server_address = ('', 8000)
-    httpd = HTTPServer(server_address, MedicalRecommendationHandler)
+    MedicalRecommendationHandler.timeout = config.request_timeout
+    if config.mode == 'async':
+        sock = run_phase('socket_bind', socket.create_server, (config.host, config.port),
+                         backlog=config.queue_size)
+        async_server = AsyncHTTPServer(threads=config.threads, keepalive_timeout=config.keepalive_timeout)
+    else:
+        httpd = run_phase('socket_bind', make_server, config)
+    display_host = config.host or 'localhost'
+    print("⏱️  Startup: " + ", ".join(f"{name.replace('_', ' ')} {seconds * 1000:.1f} ms"
+                                      for name, seconds in startup_phases.items()))
 
     print("\n🚀 Starting server...")
-    print(f"🌐 Server running at: http://localhost:8000")
+    if config.mode == 'async':
+        print(f"⚙️  Mode: async HTTP/1.1 keep-alive ({config.workers} workers x {config.threads} threads)")
+    elif config.mode == 'prefork':
+        print(f"⚙️  Mode: prefork ({config.workers} workers x {config.threads} threads)")
+    elif config.mode == 'threaded':
+        print(f"⚙️  Mode: threaded ({config.threads} threads)")
+    else:
+        print("⚙️  Mode: single")
+    if profiler is not None:
+        print(f"🔬 Profiling {config.profile_rate:.0%} of requests, see /admin/profile")
+    print(f"🌐 Server running at: http://{display_host}:{config.port}")
+    print("💓 Health checks: /healthz (live), /readyz (ready)")
     print("📱 Open this URL in your web browser")
     print("⏹️  Press Ctrl+C to stop the server")
     print("=" * 60)
 
+    if config.mode == 'async':
+        serve, close = (lambda: async_server.run(sock)), sock.close
+    else:
+        serve, close = httpd.serve_forever, httpd.server_close
+
+    multiprocess = config.mode == 'prefork' or (config.mode == 'async' and config.workers > 1)
+
+    def serve_with_reload():
+        # Threads do not survive fork(), so every serving process runs its own watcher
+        if config.reload_interval > 0:
+            KnowledgeBaseWatcher(config.reload_interval).start()
+        if multiprocess:
+            metrics.forked()
+            MetricsFlusher().start()
+        usage = record_memory_metrics()
+        if usage:
+            print(f"👷 Process {os.getpid()}: {usage['total'] / 2**20:.1f} MB resident "
+                  f"({usage.get('anon', 0) / 2**20:.1f} MB anonymous, {usage.get('file', 0) / 2**20:.1f} MB file-backed)")
+        mark_ready()
+        serve()
+
+    if multiprocess:
+        # Any worker may answer a scrape, so each one reports all of them
+        metrics_dir = tempfile.mkdtemp(prefix='medrec-metrics-')
+        metrics.share(metrics_dir)
+        try:
+            serve_prefork(serve_with_reload, close, config.workers)
+        finally:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+        print("\n\n👋 Server stopped.")
+        return
+
     try:
-        httpd.serve_forever()
+        serve_with_reload()
     except KeyboardInterrupt:
         print("\n\n👋 Server stopped by user.")
-        httpd.server_close()
+        close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the hot paths of the Personalized Medicine Recommendation System
+
+Measures ops/sec and peak memory allocated per call, writes the results as
+JSON and compares them with a stored baseline. A benchmark that got slower,
+or allocates more, by more than the threshold fails the run.
+
+    python benchmark.py                    # run, compare with the baseline
+    python benchmark.py --save-baseline    # run and store the baseline
+    python benchmark.py --only predict     # benchmarks whose name contains "predict"
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import app
+
+RESULTS_PATH = os.path.join('cache', 'benchmark.json')
+BASELINE_PATH = 'benchmark_baseline.json'
+# Symptom sets drawn from Training.csv for the prediction benchmarks
+SAMPLE_ROWS = 500
+BATCH_SIZE = 1024
+# Allocation differences below this many bytes are noise, not regressions
+ALLOC_SLACK = 1024
+
+def load_symptom_sets(limit=SAMPLE_ROWS):
+    """Symptom lists of the first rows of Training.csv, as a patient would select them"""
+    sets = []
+    with open(os.path.join(app.DATA_PATH, 'Training.csv'), 'r') as f:
+        for row in csv.DictReader(f):
+            sets.append([name for name, value in row.items() if name != 'prognosis' and value.strip() == '1'])
+            if len(sets) == limit:
+                break
+    return sets
+
+def quiet(func):
+    """Wrap func so that what it prints does not end up in the report"""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+    return run
+
+def cycling(func, items):
+    """A no-argument callable that calls func with the next item on each call"""
+    items = itertools.cycle(items)
+    return lambda: func(next(items))
+
+def cached_predictions(symptom_sets):
+    """prediction_cache lookups, all hits: the symptom sets are cached up front.
+
+    The cache bypasses every knowledge base but the current one, which the
+    load_csv_data benchmarks may replace, so it is looked up on each call.
+    """
+    def lookup(symptoms):
+        return app.prediction_cache.lookup(symptoms).predictions(app.TOP_K, app.knowledge_base)
+
+    for symptoms in symptom_sets:
+        lookup(symptoms)
+    return cycling(lookup, symptom_sets)
+
+def build_benchmarks():
+    """Return [(name, callable)] for every hot path that can run here"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        if not app.load_csv_data():
+            sys.exit("❌ Failed to load data files.")
+        has_model = app.load_model_artifacts()
+    kb = app.knowledge_base
+    handler = app.MedicalRecommendationHandler.__new__(app.MedicalRecommendationHandler)
+    symptom_sets = load_symptom_sets()
+    diseases = [record.name for record in kb.diseases if record.description]
+    predictions = [app.predict_top_k(symptoms, kb=kb) for symptoms in symptom_sets]
+    results = [
+        (symptoms, top[0][0], round(top[0][1], 2), app.get_disease_info(top[0][0], symptoms, kb), top[1:])
+        for symptoms, top in zip(symptom_sets, predictions)
+    ]
+
+    benchmarks = [
+        ('load_csv_data[snapshot]', quiet(app.load_csv_data)),
+        ('load_csv_data[csv]', quiet(lambda: app.load_csv_data(use_snapshot=False))),
+        ('predict_disease', cycling(lambda symptoms: app.predict_disease(symptoms, kb), symptom_sets)),
+        ('predict_disease[rules]',
+         cycling(lambda symptoms: app.predict_disease_rules(symptoms, app.TOP_K, kb), symptom_sets)),
+        ('prediction_cache.lookup', cached_predictions(symptom_sets)),
+        ('symptom_search', cycling(lambda query: app.symptom_search(kb).search(query),
+                                   ['s', 'skin ra', 'pain', 'stomack pain', 'dischromic _patches'])),
+        ('get_disease_info', cycling(lambda disease: app.get_disease_info(disease, kb=kb), diseases)),
+        ('get_disease_info[similar_cases]',
+         cycling(lambda pair: app.get_disease_info(pair[1][0][0], pair[0], kb), list(zip(symptom_sets, predictions)))),
+        ('generate_index_html', lambda: handler.generate_index_html(kb)),
+        ('generate_result_html', cycling(
+            lambda r: handler.generate_result_html(disease=r[1], confidence=r[2], symptoms=r[0], info=r[3],
+                                                   alternatives=r[4], kb=kb),
+            results)),
+    ]
+    if has_model:
+        predictor = app.predictor
+        batch = (symptom_sets * (BATCH_SIZE // len(symptom_sets) + 1))[:BATCH_SIZE]
+        benchmarks += [
+            ('model.predict_top_k', cycling(predictor.predict_top_k, symptom_sets)),
+            (f'model.predict_top_k_batch[{BATCH_SIZE}]', lambda: predictor.predict_top_k_batch(batch)),
+        ]
+    else:
+        print("⚠️  No trained model in 'models'; skipping model inference (run train_model.py)")
+    return benchmarks
+
+def time_ops(func, min_time, repeats):
+    """Best ops/sec over repeats, each running func for about min_time / repeats seconds.
+
+    As with timeit, the fastest repeat is the one least disturbed by the rest
+    of the machine, so it is the most reproducible figure.
+    """
+    # Calibrate the number of calls per repeat
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeats / 4:
+            break
+        number *= 2
+    number = max(1, int(number * (min_time / repeats) / max(elapsed, 1e-9)))
+
+    rates = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        rates.append(number / (time.perf_counter() - start))
+    return max(rates), number * repeats
+
+def measure_allocations(func, calls=20):
+    """Largest peak of memory allocated during a single call, in bytes"""
+    tracemalloc.start()
+    try:
+        peak = 0
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            func()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def run_benchmarks(benchmarks, min_time, repeats):
+    """Run every benchmark and return {name: result}"""
+    results = {}
+    print(f"{'benchmark':<40} {'ops/sec':>12} {'µs/op':>10} {'peak alloc':>12}")
+    print("-" * 77)
+    for name, func in benchmarks:
+        func()  # warm up caches and lazy imports
+        ops, iterations = time_ops(func, min_time, repeats)
+        peak = measure_allocations(func)
+        results[name] = {
+            'ops_per_sec': ops,
+            'us_per_op': 1e6 / ops,
+            'peak_alloc_bytes': peak,
+            'iterations': iterations,
+        }
+        print(f"{name:<40} {ops:>12,.1f} {1e6 / ops:>10,.1f} {peak:>12,}")
+    return results
+
+def compare(results, baseline, threshold):
+    """Print the change against the baseline and return the names that regressed"""
+    regressions = []
+    print(f"\n📊 Compared with the baseline (threshold {threshold:.0%})")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"   {name:<40} new")
+            continue
+        speed = result['ops_per_sec'] / base['ops_per_sec'] - 1
+        alloc = result['peak_alloc_bytes'] - base['peak_alloc_bytes']
+        slower = speed < -threshold
+        heavier = alloc > max(ALLOC_SLACK, base['peak_alloc_bytes'] * threshold)
+        flag = '❌' if slower or heavier else '✅'
+        print(f"{flag} {name:<40} {speed:+8.1%} ops/sec {alloc:+12,} bytes")
+        if slower or heavier:
+            regressions.append(name)
+    return regressions
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'data_version': app.knowledge_base.version,
+        'model': type(app.predictor.model).__name__ if app.predictor is not None else None,
+    }
+
+def write_json(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.write('\n')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths and compare with a baseline')
+    parser.add_argument('--only', action='append', default=[],
+                        help='Only run benchmarks whose name contains this text (repeatable)')
+    parser.add_argument('--min-time', type=float, default=1.0,
+                        help='Seconds to spend timing each benchmark (default: 1.0)')
+    parser.add_argument('--repeats', type=int, default=5,
+                        help='Timed repeats per benchmark; the fastest is reported (default: 5)')
+    parser.add_argument('--output', default=RESULTS_PATH,
+                        help=f'Where to write the results (default: {RESULTS_PATH})')
+    parser.add_argument('--baseline', default=BASELINE_PATH,
+                        help=f'Baseline to compare with (default: {BASELINE_PATH})')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store the results as the new baseline instead of comparing')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown or allocation growth that fails the run (default: 0.2)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    config = parse_args(argv)
+    print("⏱️  Personalized Medicine Recommendation System benchmarks")
+    print("=" * 77)
+
+    benchmarks = build_benchmarks()
+    if config.only:
+        benchmarks = [(name, func) for name, func in benchmarks if any(text in name for text in config.only)]
+    results = run_benchmarks(benchmarks, config.min_time, max(1, config.repeats))
+    report = {'environment': environment(), 'results': results}
+    write_json(config.output, report)
+    print(f"\n💾 Results written to {config.output}")
+
+    if config.save_baseline:
+        write_json(config.baseline, report)
+        print(f"✅ Baseline saved to {config.baseline}")
+        return 0
+    if not os.path.exists(config.baseline):
+        print(f"ℹ️  No baseline at {config.baseline}; store one with --save-baseline")
+        return 0
+
+    with open(config.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('environment', {}).get('python') != report['environment']['python']:
+        print("⚠️  The baseline was recorded with a different Python version")
+    regressions = compare(results, baseline.get('results', {}), config.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+        return 1
+    print("\n✅ No regressions")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
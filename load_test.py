@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Load generator and traffic replay for the Personalized Medicine Recommendation System
+
+Starts app.py (or targets a running server with --url) and reports requests/sec
+and p50/p95/p99 latency per route.
+
+    python load_test.py run --clients 16 --duration 10 --record traffic.ndjson
+    python load_test.py replay traffic.ndjson --server-args="--mode async"
+
+"run" drives /, /symptoms, /predict and /api/predict with concurrent
+closed-loop clients: each client sends its next request as soon as the
+previous one is answered. "replay" sends a recorded request log open-loop:
+every request goes out at its recorded time whether or not earlier ones have
+been answered, and latency is measured from that scheduled time, so a slow
+server shows up as latency instead of as fewer requests.
+"""
+
+import argparse
+import csv
+import http.client
+import json
+import math
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlparse
+
+DATA_PATH = 'Datasets and Rename'
+DEFAULT_MIX = '/=1,/symptoms=1,/predict=3,/api/predict=5'
+# Sent with every request, like a browser would
+DEFAULT_HEADERS = {'Accept-Encoding': 'gzip, deflate'}
+STARTUP_TIMEOUT = 60
+
+def load_symptom_sets(data_path=DATA_PATH):
+    """Symptom lists of every row in Training.csv"""
+    sets = []
+    with open(os.path.join(data_path, 'Training.csv'), 'r') as f:
+        for row in csv.DictReader(f):
+            symptoms = [name for name, value in row.items() if name != 'prognosis' and value.strip() == '1']
+            if symptoms:
+                sets.append(symptoms)
+    return sets
+
+def parse_mix(text):
+    """Parse 'route=weight,...' into ([routes], [weights])"""
+    routes, weights = [], []
+    for item in text.split(','):
+        route, _, weight = item.partition('=')
+        routes.append(route.strip())
+        weights.append(float(weight or 1))
+    return routes, weights
+
+def make_request(route, symptom_sets, rng):
+    """Build one request for a route as a log record"""
+    request = {'method': 'GET', 'path': route, 'headers': dict(DEFAULT_HEADERS), 'body': ''}
+    if route in ('/predict', '/api/predict'):
+        # A patient reports some, not all, of a case's symptoms
+        case = rng.choice(symptom_sets)
+        symptoms = rng.sample(case, rng.randint(1, len(case)))
+        request['method'] = 'POST'
+        if route == '/predict':
+            request['headers']['Content-Type'] = 'application/x-www-form-urlencoded'
+            request['body'] = urlencode([('symptoms', s) for s in symptoms])
+        else:
+            request['headers']['Content-Type'] = 'application/json'
+            request['body'] = json.dumps({'symptoms': symptoms})
+    return request
+
+class Client:
+    """One keep-alive connection per thread, reopened whenever the server closes it"""
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def send(self, request):
+        """Send a request and return its status, or raise on a connection failure"""
+        conn = getattr(self.local, 'conn', None)
+        for attempt in range(2):
+            if conn is None:
+                conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                body = request['body'].encode() if request['body'] else None
+                conn.request(request['method'], request['path'], body=body, headers=request['headers'])
+                response = conn.getresponse()
+                response.read()
+                if response.will_close:
+                    conn.close()
+                    self.local.conn = None
+                return response.status
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # A kept-alive connection the server already dropped; retry once on a fresh one
+                conn.close()
+                conn = self.local.conn = None
+                if attempt:
+                    raise
+            except Exception:
+                conn.close()
+                self.local.conn = None
+                raise
+
+class Recorder:
+    """Collects (route, latency, ok) samples and, optionally, the request log"""
+
+    def __init__(self, log_path=None):
+        self.samples = []
+        self.lock = threading.Lock()
+        self.log = open(log_path, 'w') if log_path else None
+
+    def add(self, request, offset, latency, status):
+        ok = status is not None and status < 400
+        route = urlparse(request['path']).path
+        with self.lock:
+            self.samples.append((route, latency, ok))
+            if self.log is not None:
+                self.log.write(json.dumps(dict(request, t=round(offset, 6))) + '\n')
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(q / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+def summarize(samples, elapsed):
+    """Per-route and overall request counts, errors, req/s and latency percentiles in ms"""
+    by_route = {}
+    for route, latency, ok in samples:
+        by_route.setdefault(route, []).append((latency, ok))
+    by_route['TOTAL'] = [(latency, ok) for _, latency, ok in samples]
+
+    report = {}
+    for route, entries in by_route.items():
+        latencies = sorted(latency for latency, _ in entries)
+        report[route] = {
+            'requests': len(entries),
+            'errors': sum(1 for _, ok in entries if not ok),
+            'rps': len(entries) / elapsed if elapsed > 0 else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+        }
+    return report
+
+def print_report(report, elapsed):
+    print(f"\n📊 Results over {elapsed:.1f}s")
+    print(f"{'route':<16} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8}")
+    print("-" * 80)
+    for route, row in sorted(report.items(), key=lambda item: (item[0] == 'TOTAL', item[0])):
+        print(f"{route:<16} {row['requests']:>9} {row['errors']:>7} {row['rps']:>9.1f} {row['p50_ms']:>8.2f} "
+              f"{row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['max_ms']:>8.2f}")
+
+def run_closed_loop(client, config, recorder):
+    """Concurrent clients sending back-to-back requests for config.duration seconds"""
+    symptom_sets = load_symptom_sets()
+    routes, weights = parse_mix(config.mix)
+    start = time.perf_counter()
+    deadline = start + config.duration
+
+    def worker(seed):
+        rng = random.Random(seed)
+        while True:
+            request = make_request(rng.choices(routes, weights)[0], symptom_sets, rng)
+            sent = time.perf_counter()
+            if sent >= deadline:
+                return
+            try:
+                status = client.send(request)
+            except (OSError, http.client.HTTPException):
+                status = None
+            recorder.add(request, sent - start, time.perf_counter() - sent, status)
+
+    threads = [threading.Thread(target=worker, args=(config.seed + i,)) for i in range(config.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+def run_open_loop(client, config, recorder):
+    """Send the requests of a log at their recorded times, scaled by config.speed"""
+    with open(config.log) as f:
+        requests = [json.loads(line) for line in f if line.strip()]
+    requests.sort(key=lambda request: request['t'])
+    print(f"🔁 Replaying {len(requests)} requests at {config.speed:g}x speed")
+
+    def send(request, scheduled):
+        try:
+            status = client.send(request)
+        except (OSError, http.client.HTTPException):
+            status = None
+        # Measured from the scheduled time so queueing behind slow requests counts
+        recorder.add(request, scheduled - start, time.perf_counter() - scheduled, status)
+
+    with ThreadPoolExecutor(max_workers=config.max_in_flight) as executor:
+        start = time.perf_counter()
+        for request in requests:
+            scheduled = start + request['t'] / config.speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, request, scheduled)
+    return time.perf_counter() - start
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(port, server_args):
+    """Start app.py on port and wait until /readyz reports it ready"""
+    command = [sys.executable, 'app.py', '--host', '127.0.0.1', '--port', str(port)] + shlex.split(server_args)
+    print(f"🚀 Starting server: {' '.join(command[1:])}")
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"❌ Server exited with status {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/readyz')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return process
+        except OSError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    sys.exit("❌ Server did not start in time")
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load test app.py and report latency per route')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--url', help='Test a server that is already running instead of starting app.py')
+    common.add_argument('--server-args', default='',
+                        help='Extra app.py arguments, e.g. "--mode async --workers 4"')
+    common.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds (default: 30)')
+    common.add_argument('--json', help='Also write the report to this JSON file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', parents=[common], help='Closed-loop load with concurrent clients')
+    run.add_argument('--clients', type=int, default=16, help='Concurrent clients (default: 16)')
+    run.add_argument('--duration', type=float, default=10, help='Seconds to run (default: 10)')
+    run.add_argument('--mix', default=DEFAULT_MIX, help=f'Route weights (default: {DEFAULT_MIX})')
+    run.add_argument('--seed', type=int, default=0, help='Random seed for the request mix (default: 0)')
+    run.add_argument('--record', help='Write the requests sent to this NDJSON log for replay')
+
+    replay = subparsers.add_parser('replay', parents=[common], help='Open-loop replay of a recorded log')
+    replay.add_argument('log', help='NDJSON request log written by run --record')
+    replay.add_argument('--speed', type=float, default=1.0,
+                        help='Replay speed factor; 2 sends the same traffic in half the time (default: 1)')
+    replay.add_argument('--max-in-flight', type=int, default=256,
+                        help='Most requests outstanding at once (default: 256)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    config = parse_args(argv)
+    print("🏋️  Personalized Medicine Recommendation System load test")
+    print("=" * 80)
+
+    process = None
+    if config.url:
+        target = urlparse(config.url)
+        host, port = target.hostname, target.port or 80
+    else:
+        host, port = '127.0.0.1', free_port()
+        process = start_server(port, config.server_args)
+
+    client = Client(host, port, config.timeout)
+    recorder = Recorder(getattr(config, 'record', None))
+    try:
+        if config.command == 'run':
+            print(f"⚙️  {config.clients} clients for {config.duration:g}s against {host}:{port}")
+            elapsed = run_closed_loop(client, config, recorder)
+        else:
+            elapsed = run_open_loop(client, config, recorder)
+    finally:
+        recorder.close()
+        if process is not None:
+            stop_server(process)
+
+    report = summarize(recorder.samples, elapsed)
+    print_report(report, elapsed)
+    if getattr(config, 'record', None):
+        print(f"\n💾 Request log written to {config.record}")
+    if config.json:
+        with open(config.json, 'w') as f:
+            json.dump({'command': config.command, 'elapsed': elapsed, 'routes': report}, f, indent=2)
+            f.write('\n')
+        print(f"💾 Report written to {config.json}")
+    return 1 if report.get('TOTAL', {}).get('errors') else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,415 @@
+"""
+NumPy-only inference for the models trained by train_model.py
+
+The server scores symptom vectors with these classes instead of the pickled
+scikit-learn estimators, so its workers never import scikit-learn. export()
+turns a fitted estimator into the matching runtime model, which reproduces
+the estimator's predict and predict_proba; train_model.py checks that
+against scikit-learn on Training.csv before saving it.
+
+Only arrays and plain attributes are kept, so a runtime model pickled into
+the model bundle is memory-mapped by the workers like any other array.
+"""
+
+import numpy as np
+
+# Bump when the attributes of a runtime model change
+RUNTIME_FORMAT = 2
+
+class RuntimeModel:
+    """Common interface: classes_, n_features_in_, predict and predict_proba"""
+
+    def __init__(self, classes, n_features):
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = int(n_features)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def predict_proba(self, X):
+        raise NotImplementedError
+
+def softmax(scores):
+    """Row-wise softmax, computed like sklearn.utils.extmath.softmax"""
+    scores = scores - scores.max(axis=1, keepdims=True)
+    np.exp(scores, out=scores)
+    scores /= scores.sum(axis=1, keepdims=True)
+    return scores
+
+class SoftmaxRegression(RuntimeModel):
+    """Multinomial LogisticRegression: softmax(X @ coef.T + intercept)"""
+
+    def __init__(self, classes, coef, intercept):
+        super().__init__(classes, coef.shape[1])
+        self.coef = np.ascontiguousarray(coef.T, dtype=np.float64)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+
+    def decision_function(self, X):
+        return X @ self.coef + self.intercept
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.decision_function(X), axis=1)]
+
+    def predict_proba(self, X):
+        return softmax(self.decision_function(X))
+
+class NaiveBayes(RuntimeModel):
+    """MultinomialNB: joint log-likelihood X @ feature_log_prob.T + class_log_prior"""
+
+    def __init__(self, classes, feature_log_prob, class_log_prior):
+        super().__init__(classes, feature_log_prob.shape[1])
+        self.feature_log_prob = np.ascontiguousarray(feature_log_prob.T, dtype=np.float64)
+        self.class_log_prior = np.asarray(class_log_prior, dtype=np.float64)
+
+    def joint_log_likelihood(self, X):
+        return X @ self.feature_log_prob + self.class_log_prior
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.joint_log_likelihood(X), axis=1)]
+
+    def predict_proba(self, X):
+        jll = self.joint_log_likelihood(X)
+        # exp(jll - logsumexp(jll)), with logsumexp computed like scipy's
+        top = jll.max(axis=1, keepdims=True)
+        log_norm = np.log(np.exp(jll - top).sum(axis=1, keepdims=True)) + top
+        return np.exp(jll - log_norm)
+
+class OneVsOneSVC(RuntimeModel):
+    """SVC with a linear kernel, scored the way libsvm scores it.
+
+    The decision value of the pair of classes (i, j), i < j, sums
+    dual coefficient times kernel value over the support vectors of class
+    i, then over those of class j, then subtracts rho, in the same order
+    as libsvm: with 0/1 features the values come out bit for bit the same,
+    which matters because a pair that does not involve any of the given
+    symptoms scores (almost) exactly 0. predict takes the one-vs-one vote,
+    ties going to the lower class index.
+
+    predict_proba only needs the decision values up to rounding, so it
+    takes them from each pair's primal weights with one matrix product,
+    applies each pair's Platt sigmoid and couples the pairwise
+    probabilities like libsvm.
+    """
+
+    # Pairwise probabilities are clipped to [MIN_PROB, 1 - MIN_PROB], as in libsvm
+    MIN_PROB = 1e-7
+    # Rows scored at a time; bounds the (rows, terms, pairs) array of products
+    CHUNK = 64
+    # Rows given probabilities at a time; bounds the (classes, classes, rows) coupling matrices
+    PROBA_CHUNK = 1024
+
+    def __init__(self, classes, support_vectors, n_support, dual_coef, intercept, prob_a=None, prob_b=None):
+        super().__init__(classes, support_vectors.shape[1])
+        n_classes = len(self.classes_)
+        self.support_vectors = np.ascontiguousarray(support_vectors.T, dtype=np.float64)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self.prob_a = None if prob_a is None else np.asarray(prob_a, dtype=np.float64)
+        self.prob_b = None if prob_b is None else np.asarray(prob_b, dtype=np.float64)
+        first, second = np.triu_indices(n_classes, 1)
+        self.first = first.astype(np.intp)
+        self.second = second.astype(np.intp)
+
+        # terms[pair, m] is the m-th (support vector, coefficient) of the pair's sum,
+        # padded with coefficient 0 (adding 0.0 leaves a sum unchanged)
+        start = np.concatenate([[0], np.cumsum(n_support)])
+        width = max(n_support[i] + n_support[j] for i, j in zip(first, second))
+        self.term_vectors = np.zeros((len(first), width), dtype=np.intp)
+        self.term_coefs = np.zeros((len(first), width))
+        for pair, (i, j) in enumerate(zip(first, second)):
+            vectors = np.r_[start[i]:start[i + 1], start[j]:start[j + 1]]
+            self.term_vectors[pair, :len(vectors)] = vectors
+            self.term_coefs[pair, :len(vectors)] = np.r_[dual_coef[j - 1, start[i]:start[i + 1]],
+                                                         dual_coef[i, start[j]:start[j + 1]]]
+        self.term_vectors = np.ascontiguousarray(self.term_vectors.T)
+        self.term_coefs = np.ascontiguousarray(self.term_coefs.T)
+        # pair_weights[:, pair] is w with decision value X @ w + intercept[pair]
+        self.pair_weights = np.einsum('fmp,mp->fp', self.support_vectors[:, self.term_vectors], self.term_coefs)
+
+    def decision_function(self, X):
+        """One-vs-one decision values, one column per pair"""
+        kernel = np.asarray(X, dtype=np.float64) @ self.support_vectors
+        decision = np.empty((len(kernel), len(self.first)))
+        for start in range(0, len(kernel), self.CHUNK):
+            terms = np.take(kernel[start:start + self.CHUNK], self.term_vectors, axis=1)
+            terms *= self.term_coefs
+            # Add the terms one after another, in libsvm's order
+            chunk = decision[start:start + self.CHUNK]
+            chunk[:] = terms[:, 0]
+            for m in range(1, terms.shape[1]):
+                chunk += terms[:, m]
+        # libsvm subtracts rho, and intercept = -rho
+        decision += self.intercept
+        return decision
+
+    def predict(self, X):
+        decision = self.decision_function(X)
+        votes = np.zeros((len(decision), len(self.classes_)), dtype=np.intp)
+        winners = np.where(decision > 0, self.first, self.second)
+        rows = np.broadcast_to(np.arange(len(decision))[:, None], winners.shape)
+        np.add.at(votes, (rows, winners), 1)
+        return self.classes_[np.argmax(votes, axis=1)]
+
+    def predict_proba(self, X):
+        if self.prob_a is None:
+            raise AttributeError("predict_proba is not available when the SVC was fitted with probability=False")
+        X = np.asarray(X, dtype=np.float64)
+        n_classes = len(self.classes_)
+        proba = np.empty((len(X), n_classes))
+        for start in range(0, len(X), self.PROBA_CHUNK):
+            f = X[start:start + self.PROBA_CHUNK] @ self.pair_weights
+            f += self.intercept
+            # libsvm's sigmoid_predict, in the form that avoids cancellation
+            f *= self.prob_a
+            f += self.prob_b
+            e = np.exp(-np.abs(f))
+            pairwise = np.where(f >= 0, e, 1.0)
+            pairwise /= 1.0 + e
+            np.clip(pairwise, self.MIN_PROB, 1 - self.MIN_PROB, out=pairwise)
+            chunk = proba[start:start + self.PROBA_CHUNK]
+            if n_classes == 2:
+                chunk[:, 0] = pairwise[:, 0]
+                chunk[:, 1] = 1 - pairwise[:, 0]
+            else:
+                chunk[:] = couple_pairwise(pairwise, self.first, self.second, n_classes)
+        return proba
+
+# Below this many samples couple_pairwise works sample by sample; above it,
+# stepping all samples together pays for numpy's per-call overhead
+COUPLING_BATCH = 8
+
+def couple_pairwise(pairwise, first, second, k):
+    """Class probabilities from pairwise ones, pairwise[n, m] = P(first[m] | first[m] or second[m]).
+
+    libsvm's multiclass_probability (Wu, Lin and Weng, 2004, method 2):
+    Gauss-Seidel sweeps over the classes until max |Qp - pQp| < 0.005 / k.
+    Each sample runs the same sweeps and stops at the same point as in
+    libsvm, so the results agree to rounding. p is kept unnormalized, as
+    u / total, instead of rescaling all of p and Qp after every step.
+
+    The sweeps step every sample at once, with arrays laid out class
+    first so that each step reads contiguous rows. Step t only reads
+    (Qp)[t], and every sweep recomputes Qp, so a step only updates the
+    entries after t. A sample that has converged keeps its p while the
+    others go on, as libsvm stops there.
+    """
+    r = pairwise.T
+    n = r.shape[1]
+    # Q[t, t] = sum over j != t of r[j, t]^2 and Q[i, j] = -r[j, i] * r[i, j], with
+    # r[i, j] = P(i | i or j); laid out as Q[t, j, sample]
+    classes = np.arange(k)
+    Q = np.empty((k, k, n))
+    # Fill in the squares first, so that the diagonal is the sum of each row
+    Q[first, second] = (1 - r) ** 2
+    Q[second, first] = r ** 2
+    Q[classes, classes] = 0
+    diagonal = Q.sum(axis=1)
+    off_diagonal = r * (r - 1)
+    Q[first, second] = off_diagonal
+    Q[second, first] = off_diagonal
+    Q[classes, classes] = diagonal
+    max_iter = max(100, k)
+    eps = 0.005 / k
+    if n < COUPLING_BATCH:
+        return np.array([couple_one(np.ascontiguousarray(Q[:, :, i]), max_iter, eps) for i in range(n)])
+
+    p = np.full((k, n), 1.0 / k)
+    converged = np.zeros(n, dtype=bool)
+    product = np.empty((k, n))
+    for _ in range(max_iter):
+        Qp = np.einsum('tjn,jn->tn', Q, p)
+        pQp = np.einsum('tn,tn->n', p, Qp)
+        converged |= np.abs(Qp - pQp).max(axis=0) < eps
+        if converged.all():
+            break
+        u = p.copy()
+        total = np.ones(n)
+        for t in range(k):
+            qp_t = Qp[t] / total
+            q_tt = diagonal[t]
+            diff = (pQp - qp_t) / q_tt
+            scale = 1.0 + diff
+            pQp = (pQp + diff * (diff * q_tt + 2 * qp_t)) / scale / scale
+            step = diff * total
+            u[t] += step
+            rest = product[t + 1:]
+            np.multiply(Q[t, t + 1:], step, out=rest)
+            Qp[t + 1:] += rest
+            total *= scale
+        u /= total
+        p = np.where(converged, p, u)
+    return p.T
+
+def couple_one(Q, max_iter, eps):
+    """couple_pairwise for one sample, given its Q matrix.
+
+    Computes (Qp)[t] when step t needs it, so a step costs one dot product,
+    and does the scalar work on plain floats.
+    """
+    k = len(Q)
+    dots = [row.dot for row in Q]
+    diagonal = Q.diagonal().tolist()
+    p = np.full(k, 1.0 / k)
+    for _ in range(max_iter):
+        Qp = Q.dot(p)
+        pQp = p.dot(Qp)
+        if np.abs(Qp - pQp).max() < eps:
+            break
+        u = p.copy()
+        pQp = float(pQp)
+        total = 1.0
+        for t in range(k):
+            # Plain floats: arithmetic on NumPy scalars costs several times more
+            qp_t = float(dots[t](u)) / total
+            q_tt = diagonal[t]
+            diff = (pQp - qp_t) / q_tt
+            scale = 1.0 + diff
+            pQp = (pQp + diff * (diff * q_tt + 2 * qp_t)) / scale / scale
+            u[t] += diff * total
+            total *= scale
+        p = u / total
+    return p
+
+class TreeEnsemble(RuntimeModel):
+    """Decision trees flattened into one set of node arrays.
+
+    Node i of the ensemble splits on features[i] at thresholds[i] and goes
+    to left[i] or right[i]; leaves have left[i] == -1 and their output in
+    values[i]. roots holds the first node of every tree.
+    """
+
+    def __init__(self, classes, n_features, trees, value_of):
+        super().__init__(classes, n_features)
+        features, thresholds, left, right, values, roots = [], [], [], [], [], []
+        offset = 0
+        for tree in trees:
+            roots.append(offset)
+            is_leaf = tree.children_left == -1
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            left.append(np.where(is_leaf, -1, tree.children_left + offset))
+            right.append(np.where(is_leaf, -1, tree.children_right + offset))
+            values.append(value_of(tree))
+            offset += tree.node_count
+        self.features = np.concatenate(features).astype(np.intp)
+        self.thresholds = np.concatenate(thresholds).astype(np.float64)
+        self.left = np.concatenate(left).astype(np.intp)
+        self.right = np.concatenate(right).astype(np.intp)
+        self.values = np.concatenate(values).astype(np.float64)
+        self.roots = np.asarray(roots, dtype=np.intp)
+
+    def leaves(self, X):
+        """Leaf reached in every tree, shape (n_samples, n_trees)"""
+        # Trees compare float32 features, as scikit-learn does
+        X = np.asarray(X, dtype=np.float32)
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        rows = np.broadcast_to(np.arange(len(X))[:, None], nodes.shape)
+        while True:
+            left = self.left[nodes]
+            inner = left != -1
+            if not inner.any():
+                return nodes
+            go_left = X[rows, self.features[nodes]] <= self.thresholds[nodes]
+            nodes = np.where(inner, np.where(go_left, left, self.right[nodes]), nodes)
+
+class Forest(TreeEnsemble):
+    """RandomForestClassifier: the mean of the trees' leaf class distributions"""
+
+    def __init__(self, classes, n_features, trees):
+        def class_distribution(tree):
+            value = tree.value[:, 0, :len(classes)]
+            total = value.sum(axis=1, keepdims=True)
+            return value / np.where(total == 0, 1, total)
+        super().__init__(classes, n_features, trees, class_distribution)
+
+    def predict_proba(self, X):
+        return self.values[self.leaves(X)].mean(axis=1)
+
+class GradientBoosting(TreeEnsemble):
+    """GradientBoostingClassifier with the multinomial loss.
+
+    Stage s has one regression tree per class; the raw score of a class is
+    the initial score plus learning_rate times its trees' leaf values, and
+    the probabilities are the softmax of the raw scores.
+    """
+
+    def __init__(self, classes, n_features, stages, learning_rate, init_scores):
+        n_classes = len(classes)
+        trees = [stage[k] for stage in stages for k in range(n_classes)]
+        super().__init__(classes, n_features, trees, lambda tree: tree.value[:, 0, 0])
+        self.learning_rate = float(learning_rate)
+        self.init_scores = np.asarray(init_scores, dtype=np.float64)
+
+    def decision_function(self, X):
+        leaf_values = self.values[self.leaves(X)]
+        n_classes = len(self.classes_)
+        per_class = leaf_values.reshape(len(leaf_values), -1, n_classes).sum(axis=1)
+        return self.init_scores + self.learning_rate * per_class
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.decision_function(X), axis=1)]
+
+    def predict_proba(self, X):
+        return softmax(self.decision_function(X))
+
+def export(estimator):
+    """The runtime model for a fitted scikit-learn estimator, or None if it has none.
+
+    Reads only the estimator's fitted attributes; scikit-learn is not
+    imported here.
+    """
+    name = type(estimator).__name__
+    classes = getattr(estimator, 'classes_', None)
+    if classes is None:
+        return None
+
+    if name == 'LogisticRegression':
+        multi_class = getattr(estimator, 'multi_class', 'auto')
+        ovr = multi_class in ('ovr', 'warn') or (
+            multi_class in ('auto', 'deprecated') and (len(classes) <= 2 or estimator.solver == 'liblinear'))
+        if ovr:
+            return None
+        return SoftmaxRegression(classes, estimator.coef_, estimator.intercept_)
+
+    if name == 'MultinomialNB':
+        return NaiveBayes(classes, estimator.feature_log_prob_, estimator.class_log_prior_)
+
+    if name == 'SVC':
+        if estimator.kernel != 'linear' or estimator.break_ties or len(classes) < 2:
+            return None
+        probability = getattr(estimator, 'probability', False)
+        # libsvm's own coefficients and intercepts; the public ones are negated for two classes
+        return OneVsOneSVC(classes, estimator.support_vectors_, estimator.n_support_,
+                           estimator._dual_coef_, estimator._intercept_,
+                           estimator.probA_ if probability else None,
+                           estimator.probB_ if probability else None)
+
+    if name == 'RandomForestClassifier':
+        if getattr(estimator, 'n_outputs_', 1) != 1:
+            return None
+        return Forest(classes, estimator.n_features_in_, [tree.tree_ for tree in estimator.estimators_])
+
+    if name == 'GradientBoostingClassifier':
+        if len(classes) <= 2 or type(estimator.init_).__name__ != 'DummyClassifier':
+            return None
+        stages = [[tree.tree_ for tree in stage] for stage in estimator.estimators_]
+        # Constant for every input: the log of the class priors, centred
+        zeros = np.zeros((1, estimator.n_features_in_), dtype=np.float32)
+        init_scores = estimator._raw_predict_init(zeros)[0]
+        return GradientBoosting(classes, estimator.n_features_in_, stages,
+                                estimator.learning_rate, init_scores)
+
+    return None
+
+def check_equivalent(estimator, runtime, X, atol=1e-9):
+    """Compare a runtime model with its estimator on X; returns a list of problems"""
+    problems = []
+    expected = estimator.predict(X)
+    actual = runtime.predict(X)
+    mismatched = int(np.sum(expected != actual))
+    if mismatched:
+        problems.append(f"predict differs on {mismatched} of {len(X)} rows")
+    if hasattr(estimator, 'predict_proba') and getattr(estimator, 'probability', True):
+        difference = np.abs(estimator.predict_proba(X) - runtime.predict_proba(X)).max()
+        if difference > atol:
+            problems.append(f"predict_proba differs by up to {difference:.3g}")
+    return problems
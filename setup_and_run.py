@@ -79,7 +79,7 @@ def train_model():
     print("\n🤖 Training machine learning model...")
     
     # Check if model already exists
-    if os.path.exists('models/disease_prediction_model.pkl'):
+    if os.path.exists('models/model.bundle') or os.path.exists('models/disease_prediction_model.pkl'):
         response = input("Model already exists. Retrain? (y/N): ").lower()
         if response != 'y':
             print("✅ Using existing model.")
@@ -87,6 +87,14 @@ def train_model():
     
     return run_command("python train_model.py", "Training machine learning model")
 
+def fetch_assets():
+    """Download Bootstrap and Font Awesome for offline use"""
+    if run_command("python app.py --fetch-assets", "Downloading static assets"):
+        return True
+    print("⚠️  Pages will be unstyled until the assets are installed: copy a release's asset archive here and run")
+    print("   'python app.py --install-assets <archive>', or start the server with --cdn-fallback.")
+    return False
+
 def start_application():
     """Start the Flask application"""
     print("\n🚀 Starting Flask application...")
@@ -127,7 +135,10 @@ def main():
         print("\n❌ Setup failed: Could not train machine learning model.")
         sys.exit(1)
     
-    # Step 4: Start application
+    # Step 4: Self-host the CSS/JS assets (optional)
+    fetch_assets()
+    
+    # Step 5: Start application
     print("\n✅ Setup completed successfully!")
     print("\n" + "="*60)
     print("🎉 Ready to start the application!")
@@ -0,0 +1,174 @@
+"""
+Versioned binary snapshots and the model bundle built on them
+
+The server keeps its compiled knowledge base in a snapshot and
+train_model.py saves the trained model as one, the model bundle. Both the
+server and the training script, including its worker processes, import
+this module, so it needs nothing but NumPy and the standard library.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import platform
+import struct
+import time
+
+import numpy as np
+
+SNAPSHOT_MAGIC = b'MEDRECSNAP'
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_ALIGNMENT = 64
+
+# Versioned model bundle written by train_model.py, see write_model_bundle
+MODEL_BUNDLE_NAME = 'model.bundle'
+# Bump when the model bundle payload changes shape
+MODEL_BUNDLE_SCHEMA = 3
+
+def write_snapshot(path, meta, payload):
+    """Write payload to a versioned binary snapshot file.
+
+    Layout: magic, header length, JSON header (meta plus the layout), then
+    the payload pickled with protocol 5. NumPy array data is written
+    out-of-band after the pickle, each buffer 64-byte aligned, so
+    read_snapshot can memory-map it instead of copying it. The header holds
+    a SHA-256 of the pickle and of every buffer, and a digest of them all
+    that identifies the contents. The file is replaced atomically. Returns
+    the header.
+    """
+    buffers = []
+    data = pickle.dumps(payload, protocol=5, buffer_callback=buffers.append)
+    raw_buffers = [buffer.raw() for buffer in buffers]
+
+    layout = []
+    checksums = [hashlib.sha256(data).hexdigest()]
+    offset = snapshot_align(len(data))
+    for raw in raw_buffers:
+        layout.append([offset, raw.nbytes])
+        checksums.append(hashlib.sha256(raw).hexdigest())
+        offset = snapshot_align(offset + raw.nbytes)
+    header_fields = dict(meta, format=SNAPSHOT_FORMAT, pickle_length=len(data), buffers=layout,
+                         checksums=checksums,
+                         digest=hashlib.sha256(''.join(checksums).encode()).hexdigest())
+    header = json.dumps(header_fields).encode()
+    body_start = snapshot_align(len(SNAPSHOT_MAGIC) + 4 + len(header))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        f.seek(body_start)
+        f.write(data)
+        for (buffer_offset, _), raw in zip(layout, raw_buffers):
+            f.seek(body_start + buffer_offset)
+            f.write(raw)
+    os.replace(tmp_path, path)
+    return header_fields
+
+def read_snapshot(path, verify=False, copy_on_write=False):
+    """Read a snapshot written by write_snapshot; returns (meta, payload) or None.
+
+    Array buffers stay memory-mapped and are shared through the page cache
+    by every process that maps the same file. They are read-only unless
+    copy_on_write is set, for code that insists on writable arrays: then a
+    page is only copied into the process if something writes to it. With
+    verify, a snapshot whose checksums do not match is rejected.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                return None
+            header_length, = struct.unpack('<I', f.read(4))
+            meta = json.loads(f.read(header_length))
+            if meta.get('format') != SNAPSHOT_FORMAT:
+                return None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY if copy_on_write else mmap.ACCESS_READ)
+    except (OSError, ValueError, struct.error):
+        return None
+
+    view = memoryview(mapped)
+    body_start = snapshot_align(len(SNAPSHOT_MAGIC) + 4 + header_length)
+    data = view[body_start:body_start + meta['pickle_length']]
+    buffers = [view[body_start + offset:body_start + offset + length]
+               for offset, length in meta['buffers']]
+    if verify:
+        checksums = [hashlib.sha256(part).hexdigest() for part in [data] + buffers]
+        if checksums != meta.get('checksums'):
+            return None
+    return meta, pickle.loads(data, buffers=buffers)
+
+def snapshot_align(offset):
+    """Round up to the snapshot buffer alignment"""
+    return -(-offset // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+def library_versions():
+    """Versions of the libraries a pickled model depends on"""
+    versions = {'python': platform.python_version(), 'numpy': np.__version__}
+    try:
+        import sklearn
+        versions['sklearn'] = sklearn.__version__
+    except ImportError:
+        pass
+    return versions
+
+def write_model_bundle(path, estimator, classes, feature_names, training=None, runtime=None):
+    """Save a trained model with its class names and vocabulary as one snapshot file.
+
+    The bundle holds runtime, the estimator exported with
+    model_runtime.export, when there is one, so that loading it needs only
+    NumPy; otherwise the scikit-learn estimator itself. The snapshot
+    header is the bundle's manifest: schema, estimator and runtime class,
+    library versions, checksums, a content digest that serves as the model
+    version, and whatever training metadata is passed in. The model's
+    arrays are stored out-of-band, so workers map them instead of each
+    unpickling a copy. Returns the manifest.
+    """
+    model = estimator if runtime is None else runtime
+    feature_names = [str(name) for name in feature_names]
+    classes = [str(label) for label in classes]
+    payload = {
+        'model': model,
+        'classes': classes,
+        'feature_names': feature_names,
+        'symptoms_dict': {symptom: idx for idx, symptom in enumerate(feature_names)},
+        'diseases_list': dict(enumerate(classes)),
+    }
+    meta = {
+        'kind': 'model_bundle',
+        'schema': MODEL_BUNDLE_SCHEMA,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'estimator': type(estimator).__name__,
+        'model': type(model).__name__,
+        'runtime': 'sklearn' if runtime is None else 'numpy',
+        'features': len(feature_names),
+        'classes': len(classes),
+        'libraries': library_versions(),
+        'training': training or {},
+    }
+    return write_snapshot(path, meta, payload)
+
+def load_model_bundle(path):
+    """Load a bundle written by write_model_bundle; returns (manifest, payload).
+
+    Raises ValueError when the file is not a bundle of this schema or its
+    checksums do not match. The arrays are mapped copy-on-write because
+    libsvm only accepts writable buffers, for bundles that hold a
+    scikit-learn SVC; nothing writes to them, so the pages stay shared
+    between processes.
+    """
+    snapshot = read_snapshot(path, verify=True, copy_on_write=True)
+    if snapshot is None:
+        raise ValueError(f"{path} is not a valid model bundle or fails its checksums")
+    meta, payload = snapshot
+    if meta.get('kind') != 'model_bundle' or meta.get('schema') != MODEL_BUNDLE_SCHEMA:
+        raise ValueError(f"{path} has an unsupported bundle schema {meta.get('schema')}")
+    trained_with = meta.get('libraries', {}).get('sklearn')
+    # A NumPy runtime model does not depend on the scikit-learn version
+    if meta.get('runtime') == 'sklearn' and trained_with and trained_with != library_versions().get('sklearn'):
+        print(f"⚠️  Model was trained with scikit-learn {trained_with}, "
+              f"running {library_versions().get('sklearn')}")
+    return meta, payload
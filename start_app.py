@@ -5,10 +5,46 @@ Simple startup script for the Personalized Medicine Recommendation System
 
 import subprocess
 import sys
+import urllib.error
+import urllib.request
 import webbrowser
 import time
 import os
 
+DEFAULT_PORT = 8000
+STARTUP_TIMEOUT = 60
+
+def server_url():
+    """Base URL of app.py, from the MEDREC_HOST and MEDREC_PORT settings it reads too"""
+    host = os.environ.get('MEDREC_HOST', '')
+    # A wildcard bind address is reachable on localhost
+    if host in ('', '0.0.0.0', '::'):
+        host = 'localhost'
+    elif ':' in host:
+        host = f'[{host}]'
+    try:
+        # app.py falls back to the default for an empty or invalid value as well
+        port = int(os.environ.get('MEDREC_PORT') or DEFAULT_PORT)
+    except ValueError:
+        port = DEFAULT_PORT
+    return f'http://{host}:{port}'
+
+def wait_until_ready(process, url, timeout=STARTUP_TIMEOUT):
+    """Poll the readiness endpoint until it answers 200; False if the server exits or times out"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, OSError):
+            # Not listening yet, or 503 while still starting
+            pass
+        time.sleep(0.1)
+    return False
+
 def main():
     print("🏥 Starting Personalized Medicine Recommendation System")
     print("=" * 60)
@@ -20,7 +56,9 @@ def main():
         'Datasets and Rename/medications.csv',
         'Datasets and Rename/diets.csv',
         'Datasets and Rename/precautions_df.csv',
-        'Datasets and Rename/workout_df.csv'
+        'Datasets and Rename/workout_df.csv',
+        'Datasets and Rename/symtoms_df.csv',
+        'Datasets and Rename/Symptom-severity.csv'
     ]
     
     missing_files = []
@@ -42,17 +80,24 @@ def main():
         # Start the application
         process = subprocess.Popen([sys.executable, 'app.py'])
         
-        # Wait a moment for the server to start
-        time.sleep(3)
+        # Wait until the data and model are loaded and the server is accepting requests
+        url = server_url()
+        if not wait_until_ready(process, url + '/readyz'):
+            if process.poll() is None:
+                process.terminate()
+                print(f"\n❌ The server did not become ready within {STARTUP_TIMEOUT}s")
+            else:
+                print(f"\n❌ The server exited with status {process.returncode}")
+            return
         
         # Open browser
         print("🌐 Opening web browser...")
-        webbrowser.open('http://localhost:8000')
+        webbrowser.open(url)
         
         print("\n" + "=" * 60)
         print("✅ Application started successfully!")
-        print("🌐 Web interface: http://localhost:8000")
-        print("📋 API endpoint: http://localhost:8000/api/predict")
+        print(f"🌐 Web interface: {url}")
+        print(f"📋 API endpoint: {url}/api/predict")
         print("⏹️  Press Ctrl+C to stop the application")
         print("=" * 60)
         
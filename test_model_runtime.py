@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Equivalence of model_runtime with scikit-learn on Training.csv
+
+Fits every model that has a NumPy runtime the way train_model.py fits it,
+exports it, and checks that the runtime gives the same predict and
+predict_proba as the estimator on full and partial symptom sets, scored
+in batches and one row at a time, and after a round trip through the
+model bundle.
+
+    python -m unittest test_model_runtime
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import model_runtime
+import train_model
+from snapshot import load_model_bundle, write_model_bundle
+
+# The models of train_model.MODELS that model_runtime.export converts
+RUNTIME_MODELS = ['SVC', 'RandomForest', 'GradientBoosting', 'MultinomialNB', 'LogisticRegression']
+# predict_proba may differ by rounding only
+ATOL = 1e-9
+
+class RuntimeEquivalenceTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with contextlib.redirect_stdout(io.StringIO()):
+            cache, train_idx, test_idx, cls.label_encoder, cls.feature_names = train_model.load_and_prepare_data()
+        train_model.init_worker(cache['path'])
+        cls.estimators = {
+            name: train_model.fit_and_score(name, train_model.HOLDOUT, train_idx, test_idx)['model']
+            for name in RUNTIME_MODELS
+        }
+        full = train_model.unpack_rows(np.arange(cache['meta']['unique_rows']), cache)
+        # Partial symptom sets: each distinct row with about half of its symptoms, three times over
+        rng = np.random.default_rng(20)
+        partial = np.vstack([full * (rng.random(full.shape) < 0.5) for _ in range(3)])
+        partial = partial[partial.any(axis=1)]
+        singles = np.eye(full.shape[1])
+        cls.sets = {'full': full, 'partial': partial, 'single symptom': singles}
+
+    def assert_equivalent(self, estimator, runtime, X):
+        np.testing.assert_array_equal(runtime.predict(X), estimator.predict(X))
+        np.testing.assert_allclose(runtime.predict_proba(X), estimator.predict_proba(X), rtol=0, atol=ATOL)
+
+    def test_runtime_matches_estimator(self):
+        for name, estimator in self.estimators.items():
+            runtime = model_runtime.export(estimator)
+            self.assertIsNotNone(runtime, name)
+            for kind, X in self.sets.items():
+                with self.subTest(model=name, rows=kind):
+                    self.assert_equivalent(estimator, runtime, X)
+
+    def test_runtime_matches_estimator_row_by_row(self):
+        # Small inputs take other paths, such as SVC's per-sample coupling
+        X = self.sets['partial'][:40]
+        for name, estimator in self.estimators.items():
+            runtime = model_runtime.export(estimator)
+            with self.subTest(model=name):
+                for row in X:
+                    self.assert_equivalent(estimator, runtime, row[None, :])
+
+    def test_runtime_from_bundle(self):
+        X = self.sets['partial']
+        with tempfile.TemporaryDirectory() as directory:
+            for name, estimator in self.estimators.items():
+                with self.subTest(model=name):
+                    path = os.path.join(directory, f'{name}.bundle')
+                    write_model_bundle(path, estimator, self.label_encoder.classes_, self.feature_names,
+                                       runtime=model_runtime.export(estimator))
+                    _, payload = load_model_bundle(path)
+                    self.assertIsInstance(payload['model'], model_runtime.RuntimeModel)
+                    self.assert_equivalent(estimator, payload['model'], X)
+
+    def test_no_runtime_for_kneighbors(self):
+        estimator = train_model.MODELS['KNeighbors']
+        X = self.sets['full']
+        fitted = type(estimator)(**estimator.get_params()).fit(X, np.arange(len(X)) % 2)
+        self.assertIsNone(model_runtime.export(fitted))
+
+if __name__ == '__main__':
+    unittest.main()
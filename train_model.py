@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold, train_test_split
 from sklearn.preprocessing import LabelEncoder
 from sklearn.svm import SVC
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
@@ -8,131 +9,397 @@ from sklearn.neighbors import KNeighborsClassifier
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import accuracy_score, confusion_matrix
-import pickle
+from sklearn.utils.validation import has_fit_parameter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from threadpoolctl import threadpool_limits
+from snapshot import MODEL_BUNDLE_NAME, load_model_bundle, write_model_bundle
+import model_runtime
+import argparse
+import hashlib
+import json
 import os
+import shutil
+import tempfile
+import time
 
-def load_and_prepare_data():
-    """Load and prepare the training data"""
-    # Load the training dataset
-    dataset_path = os.path.join('Datasets and Rename', 'Training.csv')
+DATASET_PATH = os.path.join('Datasets and Rename', 'Training.csv')
+# Deduplicated, bit-packed copies of Training.csv, one directory per file hash
+TRAIN_CACHE_PATH = os.path.join('cache', 'training')
+TRAIN_CACHE_FORMAT = 1
+CV_FOLDS = 5
+# The runtime is timed on this many single rows and on batches of this many
+# rows, the most /api/predict/batch scores at once
+TIMING_ROWS = 100
+TIMING_BATCH = 1024
+# Fold number of the fit on the whole training split that is scored on the holdout
+HOLDOUT = -1
+
+MODELS = {
+    'SVC': SVC(kernel='linear', probability=True),
+    'RandomForest': RandomForestClassifier(n_estimators=100, random_state=42),
+    'GradientBoosting': GradientBoostingClassifier(n_estimators=100, random_state=42),
+    'KNeighbors': KNeighborsClassifier(n_neighbors=5),
+    'MultinomialNB': MultinomialNB(),
+    'LogisticRegression': LogisticRegression(multi_class='multinomial', solver='lbfgs', max_iter=1000, random_state=42)
+}
+# Fitted on weighted unique rows. Their fit only sums over the rows, so the
+# weights give the same model as the CSV rows. The others are fitted on the
+# training rows in CSV split order: they sample rows (Platt scaling's internal
+# CV, bootstrap), break ties by row order (KNeighbors, tree splits) or take no
+# sample_weight, and any other order or weighting changes the model
+WEIGHTED_ROWS = {'MultinomialNB', 'LogisticRegression'}
+
+def file_digest(path):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def build_training_cache(dataset_path, directory):
+    """Collapse duplicate (symptom vector, prognosis) rows and store them bit-packed.
+
+    Writes features.npy (unique rows, np.packbits along the symptoms),
+    labels.npy (encoded prognosis per unique row), inverse.npy (unique row
+    of every CSV row, so splits of the CSV rows can still be taken) and
+    meta.json. The directory is written under a temporary name and renamed
+    into place, so a half-written cache is never picked up.
+    """
     dataset = pd.read_csv(dataset_path)
+    symptoms = dataset.drop('prognosis', axis=1)
     
-    print(f"Dataset shape: {dataset.shape}")
-    print(f"Unique diseases: {len(dataset['prognosis'].unique())}")
+    le = LabelEncoder()
+    labels = le.fit_transform(dataset['prognosis'])
+    packed = np.packbits(symptoms.to_numpy() != 0, axis=1)
+    # One key row per CSV row: the packed symptoms followed by the label
+    keys = np.column_stack([packed.astype(np.int64), labels])
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
     
-    # Separate features and target
-    X = dataset.drop('prognosis', axis=1)
-    y = dataset['prognosis']
+    meta = {
+        'format': TRAIN_CACHE_FORMAT,
+        'source': os.path.basename(dataset_path),
+        'rows': len(dataset),
+        'unique_rows': len(unique),
+        'feature_names': symptoms.columns.tolist(),
+        'classes': [str(label) for label in le.classes_],
+    }
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=os.path.dirname(directory))
+    np.save(os.path.join(staging, 'features.npy'), np.ascontiguousarray(unique[:, :-1], dtype=np.uint8))
+    np.save(os.path.join(staging, 'labels.npy'), unique[:, -1].astype(np.int32))
+    np.save(os.path.join(staging, 'inverse.npy'), inverse.reshape(-1).astype(np.int32))
+    with open(os.path.join(staging, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    try:
+        os.rename(staging, directory)
+    except OSError:
+        # Another run built the same cache first
+        shutil.rmtree(staging, ignore_errors=True)
+
+def load_training_cache(directory):
+    """Memory-map a cache written by build_training_cache"""
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('format') != TRAIN_CACHE_FORMAT:
+        raise ValueError(f"unsupported training cache format {meta.get('format')}")
+    return {
+        'path': directory,
+        'meta': meta,
+        'features': np.load(os.path.join(directory, 'features.npy'), mmap_mode='r'),
+        'labels': np.load(os.path.join(directory, 'labels.npy'), mmap_mode='r'),
+        'inverse': np.load(os.path.join(directory, 'inverse.npy'), mmap_mode='r'),
+    }
+
+def load_and_prepare_data(dataset_path=DATASET_PATH, cache_path=TRAIN_CACHE_PATH):
+    """Load and prepare the training data.
+
+    Reads the deduplicated cache of Training.csv, building it first when
+    the file has changed, and returns it with the CSV row indices of the
+    70/30 train/test split.
+    """
+    digest = file_digest(dataset_path)
+    directory = os.path.join(cache_path, f'{digest[:16]}-v{TRAIN_CACHE_FORMAT}')
+    try:
+        cache = load_training_cache(directory)
+        print(f"Using the training cache in {directory}")
+    except (FileNotFoundError, ValueError):
+        build_training_cache(dataset_path, directory)
+        cache = load_training_cache(directory)
+        print(f"Training cache written to {directory}")
+    cache['digest'] = digest
+    meta = cache['meta']
+    
+    print(f"Dataset shape: ({meta['rows']}, {len(meta['feature_names']) + 1})")
+    print(f"Unique rows: {meta['unique_rows']}")
+    print(f"Unique diseases: {len(meta['classes'])}")
     
     # Encode the target variable
     le = LabelEncoder()
-    le.fit(y)
-    Y = le.transform(y)
+    le.fit(meta['classes'])
     
-    # Split the data
-    X_train, X_test, y_train, y_test = train_test_split(X, Y, test_size=0.3, random_state=20)
+    # Split the CSV row indices, as splitting the rows themselves did
+    train_idx, test_idx = train_test_split(np.arange(meta['rows']), test_size=0.3, random_state=20)
     
-    return X_train, X_test, y_train, y_test, le, X.columns.tolist()
+    return cache, train_idx, test_idx, le, meta['feature_names']
 
-def train_models(X_train, X_test, y_train, y_test):
-    """Train multiple models and compare their performance"""
-    
-    models = {
-        'SVC': SVC(kernel='linear', probability=True),
-        'RandomForest': RandomForestClassifier(n_estimators=100, random_state=42),
-        'GradientBoosting': GradientBoostingClassifier(n_estimators=100, random_state=42),
-        'KNeighbors': KNeighborsClassifier(n_neighbors=5),
-        'MultinomialNB': MultinomialNB(),
-        'LogisticRegression': LogisticRegression(multi_class='multinomial', solver='lbfgs', max_iter=1000, random_state=42)
+def row_weights(cache, rows):
+    """How many times each unique row occurs among the given CSV rows"""
+    return np.bincount(cache['inverse'][rows], minlength=cache['meta']['unique_rows'])
+
+# Set in each worker by init_worker
+_cache = None
+
+def init_worker(cache_path):
+    """Map the shared training cache and keep BLAS to one thread per worker"""
+    global _cache
+    _cache = load_training_cache(cache_path)
+    # The pool already uses every core; nested BLAS threads would oversubscribe them
+    threadpool_limits(1)
+
+def unpack_rows(rows, cache=None):
+    """Dense float feature matrix for some unique rows of the cache (the worker's by default)"""
+    cache = cache or _cache
+    n_features = len(cache['meta']['feature_names'])
+    return np.unpackbits(cache['features'][rows], axis=1, count=n_features).astype(np.float64)
+
+def fit_and_score(model_name, fold, train_idx, test_idx):
+    """Fit a fresh copy of a model on one split and score it.
+
+    Runs in a worker. A split is given as CSV row indices. Models in
+    WEIGHTED_ROWS are fitted on each unique row once with its count as
+    sample weight; the others on the unique row of every CSV row, in the
+    split's order, which is the same X and y as the CSV rows themselves.
+    Scores are taken on the unique test rows weighted by their counts. The
+    fitted model and its predictions on the unique test rows are only sent
+    back for the holdout fit.
+    """
+    model = clone(MODELS[model_name])
+    labels = np.asarray(_cache['labels'])
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    if model_name in WEIGHTED_ROWS and has_fit_parameter(model, 'sample_weight'):
+        train_weights = row_weights(_cache, train_idx)
+        rows = np.flatnonzero(train_weights)
+        model.fit(unpack_rows(rows), labels[rows], sample_weight=train_weights[rows])
+    else:
+        rows = np.asarray(_cache['inverse'][train_idx])
+        model.fit(unpack_rows(rows), labels[rows])
+    test_weights = row_weights(_cache, test_idx)
+    test_rows = np.flatnonzero(test_weights)
+    predictions = model.predict(unpack_rows(test_rows))
+    result = {
+        'model_name': model_name,
+        'fold': fold,
+        'accuracy': accuracy_score(labels[test_rows], predictions, sample_weight=test_weights[test_rows]),
+        'wall_time': time.perf_counter() - wall_start,
+        'cpu_time': time.process_time() - cpu_start,
+    }
+    if fold == HOLDOUT:
+        result['model'] = model
+        result['test_rows'] = test_rows
+        result['predictions'] = predictions
+    return result
+
+def training_tasks(cache, train_idx, test_idx, folds):
+    """(model name, fold, train rows, test rows) for every holdout fit and CV fold"""
+    splits = [(HOLDOUT, train_idx, test_idx)]
+    if folds > 1:
+        Y = np.asarray(cache['labels'])[cache['inverse'][train_idx]]
+        skf = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+        for fold, (fit_rows, score_rows) in enumerate(skf.split(train_idx, Y)):
+            splits.append((fold, train_idx[fit_rows], train_idx[score_rows]))
+    return [(name, fold, fit, score) for name in MODELS for fold, fit, score in splits]
+
+def train_models(cache, train_idx, test_idx, folds=CV_FOLDS, jobs=None):
+    """Train multiple models and compare their performance.
+
+    Every model is fitted on each stratified k-fold split of the training
+    rows and once on all of them, which is scored on the holdout rows. The
+    fits run in a pool of jobs processes that memory-map the training cache.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    tasks = training_tasks(cache, train_idx, test_idx, folds)
+    model_results = {
+        name: {'cv_scores': [], 'wall_time': 0.0, 'cpu_time': 0.0} for name in MODELS
     }
     
-    model_results = {}
-    
-    print("Training and evaluating models...")
+    print(f"Training and evaluating {len(MODELS)} models on {len(tasks)} splits with {jobs} process(es)...")
     print("=" * 50)
     
-    for model_name, model in models.items():
-        # Train the model
-        model.fit(X_train, y_train)
-        
-        # Test the model
-        predictions = model.predict(X_test)
-        
-        # Calculate accuracy
-        accuracy = accuracy_score(y_test, predictions)
-        
-        # Store results
-        model_results[model_name] = {
-            'model': model,
-            'accuracy': accuracy,
-            'predictions': predictions
-        }
-        
-        print(f"{model_name} Accuracy: {accuracy:.4f}")
+    start = time.perf_counter()
+    if jobs == 1:
+        init_worker(cache['path'])
+        results = [fit_and_score(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)), initializer=init_worker,
+                                 initargs=(cache['path'],)) as executor:
+            futures = [executor.submit(fit_and_score, *task) for task in tasks]
+            results = [future.result() for future in as_completed(futures)]
+    elapsed = time.perf_counter() - start
+    
+    # Predictions per holdout CSV row, from those per unique row
+    holdout_unique = np.asarray(cache['inverse'][test_idx])
+    for result in results:
+        entry = model_results[result['model_name']]
+        entry['wall_time'] += result['wall_time']
+        entry['cpu_time'] += result['cpu_time']
+        if result['fold'] == HOLDOUT:
+            entry['model'] = result['model']
+            entry['accuracy'] = result['accuracy']
+            position = np.searchsorted(result['test_rows'], holdout_unique)
+            entry['predictions'] = result['predictions'][position]
+        else:
+            entry['cv_scores'].append(result['accuracy'])
+    
+    print(f"{'model':<20} {'cv accuracy':>16} {'holdout':>8} {'wall s':>8} {'cpu s':>8}")
+    for model_name, entry in model_results.items():
+        scores = np.array(entry['cv_scores']) if entry['cv_scores'] else np.array([entry['accuracy']])
+        entry['cv_mean'] = float(scores.mean())
+        entry['cv_std'] = float(scores.std())
+        print(f"{model_name:<20} {entry['cv_mean']:>9.4f} ± {entry['cv_std']:.4f} {entry['accuracy']:>8.4f} "
+              f"{entry['wall_time']:>8.2f} {entry['cpu_time']:>8.2f}")
     
     print("=" * 50)
+    total_wall = sum(entry['wall_time'] for entry in model_results.values())
+    print(f"Elapsed: {elapsed:.2f}s for {total_wall:.2f}s of fitting ({total_wall / elapsed:.1f}x)")
     
-    # Find the best model
-    best_model_name = max(model_results.keys(), key=lambda k: model_results[k]['accuracy'])
+    # Find the best model; ties on cross-validation go to the holdout accuracy
+    best_model_name = max(model_results.keys(),
+                          key=lambda k: (model_results[k]['cv_mean'], model_results[k]['accuracy']))
     best_model = model_results[best_model_name]['model']
     
-    print(f"Best model: {best_model_name} with accuracy: {model_results[best_model_name]['accuracy']:.4f}")
+    print(f"Best model: {best_model_name} with cv accuracy: {model_results[best_model_name]['cv_mean']:.4f}, "
+          f"holdout accuracy: {model_results[best_model_name]['accuracy']:.4f}")
     
     return best_model, model_results
 
-def save_model_and_data(model, label_encoder, feature_names):
-    """Save the trained model and related data"""
-    
-    # Create models directory if it doesn't exist
-    os.makedirs('models', exist_ok=True)
-    
-    # Save the model
-    with open('models/disease_prediction_model.pkl', 'wb') as f:
-        pickle.dump(model, f)
+def training_metadata(cache, model_name, model_results, folds):
+    """What the bundle records about how its model was trained"""
+    meta = cache['meta']
+    return {
+        'dataset': meta['source'],
+        'dataset_sha256': cache['digest'],
+        'rows': meta['rows'],
+        'unique_rows': meta['unique_rows'],
+        'test_size': 0.3,
+        'folds': folds,
+        'selected': model_name,
+        'models': {
+            name: {
+                'cv_mean': entry['cv_mean'],
+                'cv_std': entry['cv_std'],
+                'holdout_accuracy': float(entry['accuracy']),
+                'wall_time': round(entry['wall_time'], 3),
+                'cpu_time': round(entry['cpu_time'], 3),
+            }
+            for name, entry in model_results.items()
+        },
+    }
+
+def check_rows(cache, seed=0):
+    """Symptom vectors to check and time a runtime model on.
+
+    Every distinct row of Training.csv, the same rows with about half of
+    their symptoms dropped, and each symptom on its own. Patients enter
+    partial symptom sets, and those are where the models are least sure.
+    """
+    X = unpack_rows(np.arange(cache['meta']['unique_rows']), cache)
+    partial = X * (np.random.default_rng(seed).random(X.shape) < 0.5)
+    partial = partial[partial.any(axis=1)]
+    return np.vstack([X, partial, np.eye(X.shape[1])])
+
+def best_time(func, repeat=5):
+    """Fastest of repeat runs of func, in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def time_predict_proba(model, X):
+    """Seconds per predict_proba call on a single row and on TIMING_BATCH rows"""
+    rows = [X[i:i + 1] for i in range(min(TIMING_ROWS, len(X)))]
+    batch = X[np.arange(TIMING_BATCH) % len(X)]
+    single = best_time(lambda: [model.predict_proba(row) for row in rows]) / len(rows)
+    return single, best_time(lambda: model.predict_proba(batch))
+
+def export_runtime(model, cache):
+    """Convert the model for model_runtime, and check and time it against scikit-learn.
+
+    The check scores the check_rows of Training.csv with both and requires
+    the same predict and predict_proba. Returns None when the model has no
+    runtime, the two disagree, or the runtime is slower than scikit-learn
+    on single rows or on a batch.
+    """
+    name = type(model).__name__
+    runtime = model_runtime.export(model)
+    if runtime is None:
+        print(f"No NumPy runtime for {name}; the bundle keeps the scikit-learn model")
+        return None
+    X = check_rows(cache)
+    problems = model_runtime.check_equivalent(model, runtime, X)
+    if problems:
+        print(f"WARNING: the NumPy runtime for {name} does not match scikit-learn "
+              f"({'; '.join(problems)}); the bundle keeps the scikit-learn model")
+        return None
+    print(f"Exported {name} to model_runtime.{type(runtime).__name__}: same predict and predict_proba "
+          f"as scikit-learn on {len(X)} full and partial Training.csv symptom sets")
+    sklearn_single, sklearn_batch = time_predict_proba(model, X)
+    runtime_single, runtime_batch = time_predict_proba(runtime, X)
+    timings = (f"predict_proba per row {runtime_single * 1e6:.0f} µs against {sklearn_single * 1e6:.0f} µs, "
+               f"per {TIMING_BATCH} rows {runtime_batch * 1e3:.1f} ms against {sklearn_batch * 1e3:.1f} ms")
+    if runtime_single > sklearn_single or runtime_batch > sklearn_batch:
+        print(f"The NumPy runtime for {name} is slower than scikit-learn ({timings}); "
+              f"the bundle keeps the scikit-learn model")
+        return None
+    print(f"NumPy runtime: {timings} with scikit-learn")
+    return runtime
+
+def save_model_and_data(model, label_encoder, feature_names, training, runtime=None, models_path='models'):
+    """Save the trained model and related data as one model bundle"""
     
-    # Save the label encoder
-    with open('models/label_encoder.pkl', 'wb') as f:
-        pickle.dump(label_encoder, f)
+    path = os.path.join(models_path, MODEL_BUNDLE_NAME)
+    manifest = write_model_bundle(path, model, label_encoder.classes_, feature_names, training, runtime)
     
-    # Save feature names
-    with open('models/feature_names.pkl', 'wb') as f:
-        pickle.dump(feature_names, f)
+    # Read it back the way the server does, to check it and time the load
+    start = time.perf_counter()
+    load_model_bundle(path)
+    elapsed = time.perf_counter() - start
     
-    print("Model and related data saved successfully!")
+    size = os.path.getsize(path)
+    print(f"Model bundle saved to {path}: {manifest['model']}, version {manifest['digest'][:16]}, {size / 1024:.0f} KiB, "
+          f"{len(manifest['buffers'])} mappable arrays, loads in {elapsed * 1000:.1f} ms")
+    return manifest
 
-def create_symptoms_dict(feature_names):
-    """Create symptoms dictionary for the web application"""
-    symptoms_dict = {symptom: idx for idx, symptom in enumerate(feature_names)}
-    
-    # Save symptoms dictionary
-    with open('models/symptoms_dict.pkl', 'wb') as f:
-        pickle.dump(symptoms_dict, f)
-    
-    return symptoms_dict
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Train and compare the disease prediction models')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes for fitting; 1 trains in this process (default: CPU count)')
+    parser.add_argument('--folds', type=int, default=CV_FOLDS,
+                        help=f'Stratified cross-validation folds; 1 skips cross-validation (default: {CV_FOLDS})')
+    return parser.parse_args(argv)
 
-def main():
+def main(argv=None):
     """Main function to train and save the model"""
+    config = parse_args(argv)
     print("Starting model training process...")
     
     # Load and prepare data
-    X_train, X_test, y_train, y_test, label_encoder, feature_names = load_and_prepare_data()
+    cache, train_idx, test_idx, label_encoder, feature_names = load_and_prepare_data()
     
     # Train models
-    best_model, model_results = train_models(X_train, X_test, y_train, y_test)
-    
-    # Create symptoms dictionary
-    symptoms_dict = create_symptoms_dict(feature_names)
-    
-    # Save model and related data
-    save_model_and_data(best_model, label_encoder, feature_names)
+    best_model, model_results = train_models(cache, train_idx, test_idx, folds=config.folds, jobs=config.jobs)
     
-    # Create diseases list mapping
-    diseases_list = {idx: disease for idx, disease in enumerate(label_encoder.classes_)}
-    with open('models/diseases_list.pkl', 'wb') as f:
-        pickle.dump(diseases_list, f)
+    # Save the model with its label encoder, vocabulary and training metadata
+    best_model_name = next(name for name, entry in model_results.items() if entry['model'] is best_model)
+    training = training_metadata(cache, best_model_name, model_results, config.folds)
+    runtime = export_runtime(best_model, cache)
+    manifest = save_model_and_data(best_model, label_encoder, feature_names, training, runtime)
     
-    print(f"Total symptoms: {len(symptoms_dict)}")
-    print(f"Total diseases: {len(diseases_list)}")
+    print(f"Total symptoms: {manifest['features']}")
+    print(f"Total diseases: {manifest['classes']}")
     print("Training completed successfully!")
 
 if __name__ == "__main__":